@@ -0,0 +1,132 @@
+# Benchmark: consensus history in the SQL table layout vs the revision store
+# Storage (SQLite table, Parquet of the full rows, revision store) and latency of as-of, trajectory and revision momentum
+# queries across every ticker: pandas over the full history vs ConsensusRevisionIndex
+# Usage: python benchmarks/bench_consensus_revisions.py [--tickers 500] [--days 120] [--changed 0.03]
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from equitymarketdata.naver import CONSENSUS_KEY_COLUMNS, FINANCIAL_ITEM_KEYS, NAVER_CONSENSUS_TABLES    # noqa: E402
+from equitymarketdata.revisions import ConsensusRevisionIndex, consensus_revision_compact, consensus_revision_import_sql, revision_path    # noqa: E402
+from equitymarketdata.sink import bulk_write    # noqa: E402
+from equitymarketdata.sqlitesink import sqlite_sink    # noqa: E402
+
+PERIODS = [date(year, 12, 31) for year in range(2017, 2025)]
+EPS = 4165
+
+
+def synthesize_history(n_tickers, n_days, changed=0.03, seed=0):
+    # Rows as naverfinance_consensus_financials holds them: every figure on the first day, then only the changed ones
+    rng = np.random.default_rng(seed)
+    items = list(FINANCIAL_ITEM_KEYS.items())[:33]
+    n_figures = len(items) * len(PERIODS)
+    figures = pd.DataFrame({
+        'ticker': np.repeat(["{:06d}".format(i) for i in range(n_tickers)], n_figures),
+        'statement_period': np.tile(np.repeat(PERIODS, len(items)), n_tickers),
+        'accounting_standard': 1,
+        'financial_item_code': np.tile([code for _, code in items], len(PERIODS) * n_tickers).astype(float),
+        'forecast_indication': np.tile(np.repeat(['A'] * 4 + ['E'] * 4, len(items)), n_tickers),
+        'financial_item': np.tile([name for name, _ in items], len(PERIODS) * n_tickers)
+    })
+    code = figures['financial_item_code'].to_numpy()
+    value = np.where(code < 4000, rng.integers(10, 10 ** 5, len(figures)) * 1e8, rng.integers(1, 10 ** 6, len(figures)) / 100)
+    frames = []
+    update_date = date(2020, 1, 2)
+    for day in range(n_days):
+        flip = np.ones(len(figures), dtype=bool) if day == 0 else rng.random(len(figures)) < changed
+        if day:
+            revised = value[flip] * (1 + rng.normal(0, 0.03, flip.sum()))
+            value[flip] = np.where(code[flip] < 4000, np.round(revised / 1e8, 2) * 1e8, np.round(revised, 2))    # Naver's precision
+        frames.append(figures[flip].assign(value=value[flip], update_date=update_date))
+        update_date += timedelta(days=1 if update_date.weekday() < 4 else 3)
+    return pd.concat(frames, ignore_index=True)
+
+
+def directory_bytes(root):
+    return sum(os.path.getsize(os.path.join(path, name)) for path, _, names in os.walk(root) for name in names)
+
+
+def best_of(func, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def pandas_as_of(df_history, as_of, item_code):    # Sort the full history, keep the latest row per key
+    df = df_history[(df_history['financial_item_code'] == item_code) & (df_history['update_date'] <= as_of)]
+    return df.sort_values('update_date').drop_duplicates(subset=CONSENSUS_KEY_COLUMNS, keep='last')
+
+
+def pandas_momentum(df_history, start, end, item_code):    # Revisions per key in (start, end] with their direction
+    df = df_history[(df_history['financial_item_code'] == item_code) & (df_history['update_date'] <= end)].sort_values('update_date')
+    df = df.assign(step=np.sign(df.groupby(CONSENSUS_KEY_COLUMNS)['value'].diff()))
+    window = df[df['update_date'] > start]
+    return window.groupby(CONSENSUS_KEY_COLUMNS)['step'].agg(upgrades=lambda s: (s > 0).sum(), downgrades=lambda s: (s < 0).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, default=500)
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--changed", type=float, default=0.03, help="share of figures revised per scrape day")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        df_history = synthesize_history(args.tickers, args.days, args.changed)
+        dates = np.sort(df_history['update_date'].unique())
+        as_of, start = dates[len(dates) * 3 // 4], dates[len(dates) // 2]
+        print("{} tickers, {} scrape days, {} rows".format(args.tickers, args.days, len(df_history)))
+
+        sqlengine = sqlite_sink(os.path.join(workdir, "consensus.sqlite"))
+        bulk_write(df_history, NAVER_CONSENSUS_TABLES["Y"], sqlengine)
+        sqlite_bytes = pd.read_sql("SELECT SUM(pgsize) AS bytes FROM dbstat WHERE name IN ('{t}', 'ix_{t}_ticker');".format(t=NAVER_CONSENSUS_TABLES["Y"]), con=sqlengine)['bytes'].iloc[0]
+        df_history.to_parquet(os.path.join(workdir, "full_rows.parquet"), compression='zstd', index=False)
+        parquet_bytes = os.path.getsize(os.path.join(workdir, "full_rows.parquet"))
+        root = revision_path(os.path.join(workdir, "revisions"), "Y")
+        import_time, rows = best_of(lambda: consensus_revision_import_sql(sqlengine, root, "Y"), repeat=1)
+        store_bytes = directory_bytes(root)
+
+        print("\n{:<36}{:>14}{:>14}".format("storage", "bytes", "bytes/row"))
+        for name, size in [("SQLite table + index", sqlite_bytes), ("Parquet, full rows", parquet_bytes), ("revision store", store_bytes)]:
+            print("{:<36}{:>14,}{:>14.1f}".format(name, int(size), size / len(df_history)))
+        print("import from SQL {:.2f}s, {} revisions kept".format(import_time, rows[1]))
+
+        load_time, index = best_of(lambda: ConsensusRevisionIndex.load(root))
+        item_load_time, _ = best_of(lambda: ConsensusRevisionIndex.load(root, item_codes=[EPS]))
+        sql_load_time, _ = best_of(lambda: pd.read_sql("SELECT * FROM {};".format(NAVER_CONSENSUS_TABLES["Y"]), con=sqlengine), repeat=1)
+        print("\n{:<36}{:>12}{:>12}".format("query", "pandas(s)", "index(s)"))
+        print("{:<36}{:>12.4f}{:>12.4f}".format("load (SQL table / store)", sql_load_time, load_time))
+        print("{:<36}{:>12}{:>12.4f}".format("load one item", "", item_load_time))
+        rows = [
+            ("as-of, one item, all tickers", lambda: pandas_as_of(df_history, as_of, EPS), lambda: index.as_of(as_of, item_code=EPS)),
+            ("trajectory, one ticker and item", lambda: df_history[(df_history['ticker'] == "000007") & (df_history['financial_item_code'] == EPS)].sort_values('update_date'),
+             lambda: index.trajectory("000007", EPS)),
+            ("momentum, one item, all tickers", lambda: pandas_momentum(df_history, start, as_of, EPS), lambda: index.momentum(start, as_of, item_code=EPS, forecast_indication=None))
+        ]
+        for name, pandas_query, index_query in rows:
+            pandas_time, expected = best_of(pandas_query)
+            index_time, result = best_of(index_query)
+            print("{:<36}{:>12.4f}{:>12.4f}".format(name, pandas_time, index_time))
+        assert int(result['upgrades'].sum()) == int(expected['upgrades'].sum())
+
+        compact_time, rows = best_of(lambda: consensus_revision_compact(root, before=pd.Timestamp(start).date()), repeat=1)
+        print("\ncompaction before {}: {} -> {} revisions, {:,} bytes, {:.2f}s".format(pd.Timestamp(start).date(), rows[0], rows[1], directory_bytes(root), compact_time))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# Benchmark: end-to-end KRX pipeline and Naver consensus batch, replayed from a recording on the local stand-in server
+# into a SQLite sink; reports days/sec, tickers/sec, per-stage latency percentiles and peak memory per job
+# Usage: python benchmarks/bench_end_to_end.py [--days 40] [--tickers 200] [--latency 0.02] [--error-rate 0.01]
+#        python benchmarks/bench_end_to_end.py --recording DIR --krx 2020-01-02 2020-03-31 --naver 005930 000660 ...
+#        add --json results.json to save the results, --compare results.json to fail on a throughput regression
+# Without --recording, KRX csv downloads and Naver pages are synthesized and recorded through the fetch functions first
+# Peak memory is traced with tracemalloc (Python and numpy allocations), which slows the run; --no-memory skips it
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_krx_parse import synthesize_csv, synthesize_download    # noqa: E402
+from bench_naver_parse import synthesize_page    # noqa: E402
+from equitymarketdata.krx import krx_marketdata_fetch    # noqa: E402
+from equitymarketdata.naver import naverfinance_consensus_fetch    # noqa: E402
+from equitymarketdata.pipeline import krx_pipeline    # noqa: E402
+from equitymarketdata.replay import ResponseRecording, StandInServer, replay_responder    # noqa: E402
+from equitymarketdata.scraper import naverfinance_consensus_batch    # noqa: E402
+from equitymarketdata.sqlitesink import sqlite_sink    # noqa: E402
+from equitymarketdata.timing import StageTimer    # noqa: E402
+
+THROUGHPUT_KEYS = ['days_per_sec', 'tickers_per_sec']
+
+
+def synthesizer(num_tickers, seed=0):    # respond() producing KRX OTPs and csv downloads and Naver pages
+    rng = np.random.default_rng(seed)
+    tickers = ["{:06d}".format(i) for i in range(num_tickers)]
+
+    def respond(method, path, body):
+        parts = urlsplit(path)
+        params = dict(parse_qsl(parts.query) + parse_qsl(body.decode('utf8')))
+        if parts.path.endswith("GenerateOTP.jspx"):
+            return 200, ("OTP" + params['schdate']).encode('utf8')
+        if parts.path.endswith("download.jspx"):
+            data_date = pd.Timestamp(params['code'][3:]).date()
+            return 200, synthesize_csv(synthesize_download(data_date, tickers, rng))
+        if parts.path.endswith("cF1001.aspx"):
+            return 200, synthesize_page(rng)
+        return 404, b""
+    return respond
+
+
+def synthesize_recording(recording, dates, tickers, krx_tickers):    # Record synthesized responses through the real fetch functions
+    with StandInServer(synthesizer(krx_tickers)) as server:
+        session = server.session(recording=recording)
+        for data_date in dates:
+            krx_marketdata_fetch(data_date.strftime('%Y%m%d'), session=session, filetype='csv')
+        for ticker in tickers:
+            naverfinance_consensus_fetch(ticker, "Y", 0, session=session)
+
+
+def measure(func, memory):    # (result, seconds, peak MB or None)
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2 if memory else None
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def run_krx(server, sqlengine, dates, workers, parse_workers, memory):
+    timer = StageTimer()
+
+    def job():
+        return list(krx_pipeline(dates, sqlengine, fetch_workers=workers, holidays=set(), filetype='csv', session=server.session(workers),
+                                 retries=5, backoff=0.01, timer=timer, parse_workers=parse_workers))
+    records, elapsed, peak = measure(job, memory)
+    tickers = sum(record['numtickers'] for record in records)
+    return {'seconds': elapsed, 'days': len(records), 'days_per_sec': len(records) / elapsed, 'tickers': tickers,
+            'tickers_per_sec': tickers / elapsed, 'peak_mb': peak, 'stages': timer.summary(), 'counters': dict(timer.counters)}, timer
+
+
+def run_naver(server, sqlengine, tickers, update_date, workers, parse_workers, memory):
+    timer = StageTimer()
+
+    def job():
+        return naverfinance_consensus_batch(tickers, ["Y"], [0], update_date, sqlengine, max_workers=workers, session=server.session(workers),
+                                            retries=5, backoff=0.01, parse_workers=parse_workers, timer=timer)
+    _, elapsed, peak = measure(job, memory)
+    done = timer.counters['tickers_completed']
+    return {'seconds': elapsed, 'tickers': done, 'tickers_per_sec': done / elapsed, 'peak_mb': peak, 'stages': timer.summary(), 'counters': dict(timer.counters)}, timer
+
+
+def compare(results, baseline, tolerance):    # Print throughput changes against a saved run; True if any dropped by more than tolerance
+    regressed = False
+    print("\n{:<8}{:<18}{:>12}{:>12}{:>10}".format("job", "metric", "baseline", "now", "change"))
+    for job, result in results.items():
+        for key in THROUGHPUT_KEYS:
+            if key not in result or key not in baseline.get(job, {}):
+                continue
+            change = result[key] / baseline[job][key] - 1
+            flag = "  REGRESSION" if change < -tolerance else ""
+            regressed |= bool(flag)
+            print("{:<8}{:<18}{:>12.1f}{:>12.1f}{:>9.0%}{}".format(job, key, baseline[job][key], result[key], change, flag))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recording", default=None, help="recording made with python -m equitymarketdata.replay record")
+    parser.add_argument("--krx", nargs=2, metavar=("START", "END"), default=None, help="recorded KRX dates (csv) to replay")
+    parser.add_argument("--naver", nargs="*", default=None, metavar="TICKER", help="recorded tickers to replay")
+    parser.add_argument("--days", type=int, default=40, help="synthesized KRX days")
+    parser.add_argument("--krx-tickers", type=int, default=2500, help="tickers per synthesized KRX day")
+    parser.add_argument("--tickers", type=int, default=200, help="synthesized Naver tickers")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--parse-workers", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--json", default=None, help="save results to this file")
+    parser.add_argument("--compare", default=None, help="results file of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed throughput drop against --compare")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    if args.recording is None:
+        dates = pd.bdate_range("2020-01-02", periods=args.days)
+        tickers = ["{:06d}".format(i) for i in range(args.tickers)]
+        recording = ResponseRecording(os.path.join(tmp, "recording"))
+        start = time.perf_counter()
+        synthesize_recording(recording, dates, tickers, args.krx_tickers)
+        print("Synthesized {} KRX days and {} Naver pages in {:.1f}s".format(len(dates), len(tickers), time.perf_counter() - start))
+    else:
+        dates = pd.bdate_range(*args.krx) if args.krx else []
+        tickers = args.naver or []
+        recording = ResponseRecording(args.recording)
+
+    results = {}
+    timers = {}
+    with StandInServer(replay_responder(recording), args.latency, args.jitter, args.error_rate, seed=0) as server:
+        sqlengine = sqlite_sink(os.path.join(tmp, "marketdata.db"))
+        if len(dates):
+            results['krx'], timers['krx'] = run_krx(server, sqlengine, dates, args.workers, args.parse_workers, not args.no_memory)
+        if tickers:
+            results['naver'], timers['naver'] = run_naver(server, sqlengine, tickers, date(2020, 1, 2), args.workers, args.parse_workers, not args.no_memory)
+        print("\n{} requests served, {} failed on purpose".format(server.requests, server.errors))
+
+    print("\n{:<8}{:>10}{:>10}{:>10}{:>12}{:>14}{:>10}".format("job", "seconds", "days", "days/s", "tickers", "tickers/s", "peak MB"))
+    for job, result in results.items():
+        print("{:<8}{:>10.2f}{:>10}{:>10}{:>12}{:>14.1f}{:>10}".format(
+            job, result['seconds'], result.get('days', '-'), "{:.1f}".format(result['days_per_sec']) if 'days_per_sec' in result else '-',
+            result['tickers'], result['tickers_per_sec'], "-" if result['peak_mb'] is None else "{:.0f}".format(result['peak_mb'])))
+    for job, timer in timers.items():
+        print("\n" + job)
+        timer.report()
+
+    if args.json:
+        with open(args.json, 'w') as fd:
+            json.dump(results, fd, indent=1, default=float)
+    if args.compare:
+        with open(args.compare) as fd:
+            if compare(results, json.load(fd), args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# Benchmark: KRX backfill throughput (days/second) as concurrency scales, against a local stand-in HTTP server
+# Usage: python benchmarks/bench_krx_backfill.py [--days 60] [--latency 0.05]
+import argparse
+import os
+import sys
+import time
+from functools import partial
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from equitymarketdata.backfill import krx_backfill    # noqa: E402
+from equitymarketdata.krx import krx_marketdata_fetch    # noqa: E402
+from equitymarketdata.replay import StandInServer    # noqa: E402
+
+
+PAYLOAD = b"x" * 200000    # Roughly the size of one day's xls file
+
+
+def respond(method, path, body):    # GenerateOTP.jspx and download.jspx stand-ins
+    return 200, b"OTPCODE" if path.startswith("/otp") else PAYLOAD
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server = StandInServer(respond, latency=args.latency)
+    fetch = partial(krx_marketdata_fetch, otp_url=server.url + "/otp", down_url=server.url + "/download")
+
+    dates = pd.bdate_range("2019-01-02", periods=args.days)
+    print("{:>8}{:>12}{:>12}".format("workers", "seconds", "days/sec"))
+    for workers in [1, 2, 4, 8, 16]:
+        start = time.perf_counter()
+        fetched = sum(1 for _, content in krx_backfill(dates, max_workers=workers, holidays=set(), fetch=fetch, parse=lambda content, data_date, filetype: content) if content is not None)
+        elapsed = time.perf_counter() - start
+        print("{:>8}{:>12.3f}{:>12.1f}".format(workers, elapsed, fetched / elapsed))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
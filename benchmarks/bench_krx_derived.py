@@ -0,0 +1,60 @@
+# Benchmark: full recomputation of derived KRX figures, then one incremental day
+# Usage: python benchmarks/bench_krx_derived.py [--root /tmp/krx_store_bench] [--derived /tmp/krx_derived_bench] [--check-days 250]
+# The snapshot store is the one bench_krx_store.py builds (10 years x 2,500 tickers by default)
+# The incremental output is then checked against a full recompute over the last check-days dates, the newest included
+import argparse
+import os
+import shutil
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from equitymarketdata.analytics import krx_derived_read, krx_derived_update    # noqa: E402
+from equitymarketdata.store import store_dates    # noqa: E402
+
+
+def derived_frame(root, start):    # Derived rows from start on in (data_date, ticker) order, tickers as plain strings
+    df = krx_derived_read(root, start=start)
+    df['ticker'] = df['ticker'].astype(str)
+    return df.sort_values(['data_date', 'ticker']).reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", default="/tmp/krx_store_bench")
+    parser.add_argument("--derived", default="/tmp/krx_derived_bench")
+    parser.add_argument("--check-days", type=int, default=250, help="store dates compared with a full recompute")
+    args = parser.parse_args()
+
+    dates = store_dates(args.root)
+    if not dates:
+        print("no snapshots under " + args.root + "; run bench_krx_store.py first")
+        return
+    shutil.rmtree(args.derived, ignore_errors=True)
+    start = time.perf_counter()
+    written = krx_derived_update(args.root, args.derived, end=dates[-2])
+    print("full: {} dates in {:.1f}s".format(len(written), time.perf_counter() - start))
+
+    start = time.perf_counter()
+    written = krx_derived_update(args.root, args.derived)
+    print("incremental: {} date in {:.2f}s".format(len(written), time.perf_counter() - start))
+
+    # The same window recomputed in one pass must match what the full + incremental runs wrote
+    recomputed = args.derived + "_full"
+    shutil.rmtree(recomputed, ignore_errors=True)
+    try:
+        krx_derived_update(args.root, recomputed, full=True)
+        check_start = dates[max(0, len(dates) - args.check_days)]
+        frames = [derived_frame(root, check_start) for root in (args.derived, recomputed)]
+        assert frames[0]['data_date'].iloc[-1] == dates[-1]
+        pd.testing.assert_frame_equal(*frames)
+        print("incremental equals full recompute: {} rows from {} to {}".format(len(frames[0]), check_start, dates[-1]))
+    finally:
+        shutil.rmtree(recomputed, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
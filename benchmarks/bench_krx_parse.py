@@ -0,0 +1,117 @@
+# Benchmark: per-day parse time of KRX downloads, pd.read_excel path vs the dedicated xls and csv parsers
+# Usage: python benchmarks/bench_krx_parse.py [--samples DIR]
+# DIR holds saved downloads (*.xls, *.csv); without it samples are synthesized (xls needs xlwt)
+# Before timing, the xlrd and csv parsers are checked to return the pd.read_excel frame of the xls with the same name
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_krx_store import synthetic_day    # noqa: E402
+from equitymarketdata.krx import KRX_COLUMNS, krx_marketdata_parse_csv, krx_marketdata_parse_excel, krx_marketdata_parse_xls    # noqa: E402
+
+KRX_HEADERS = {english: korean for korean, english in KRX_COLUMNS.items()}
+
+
+def synthesize_download(data_date, tickers, rng):    # Frame with the headers and percentage units of a KRX download
+    df = synthetic_day(data_date, tickers, rng).drop(columns='data_date')
+    df[['price_change_pct', 'market_weight_pct', 'foreign_shareholding_pct']] *= 100
+    df.columns = [KRX_HEADERS[column] for column in df.columns]
+    return df
+
+
+def synthesize_csv(df):    # csv download bytes (cp949, quoted thousands separators) of a synthesize_download frame
+    text = df.copy()
+    for column in text.columns[2:]:
+        text[column] = ['{:,}'.format(value) for value in text[column]]
+    return text.to_csv(index=False).encode('cp949')
+
+
+def synthesize_samples(directory, tickers=2500):    # One csv and, with xlwt, one xls
+    df = synthesize_download(date(2020, 1, 2), ["{:06d}".format(i) for i in range(tickers)], np.random.default_rng(0))
+    with open(os.path.join(directory, "sample.csv"), 'wb') as fd:
+        fd.write(synthesize_csv(df))
+    try:
+        import xlwt
+    except ImportError:
+        print("xlwt not installed; skipping synthesized xls sample")
+        return
+    book = xlwt.Workbook()
+    sheet = book.add_sheet("sheet1")
+    for j, header in enumerate(df.columns):
+        sheet.write(0, j, header)
+    for i, row in enumerate(df.itertuples(index=False), start=1):
+        for j, value in enumerate(row):
+            sheet.write(i, j, value if isinstance(value, str) else float(value))
+    book.save(os.path.join(directory, "sample.xls"))
+
+
+def check_parity(xls_paths, csv_paths):    # Fast parsers against krx_marketdata_parse_excel of the same day's xls
+    references = {}
+    for path in xls_paths:
+        with open(path, 'rb') as fd:
+            content = fd.read()
+        references[os.path.splitext(path)[0]] = expected = krx_marketdata_parse_excel(content, date(2020, 1, 2))
+        pd.testing.assert_frame_equal(krx_marketdata_parse_xls(content, date(2020, 1, 2)), expected)
+    checked = 0
+    for path in csv_paths:
+        expected = references.get(os.path.splitext(path)[0])
+        if expected is None:
+            continue
+        with open(path, 'rb') as fd:
+            pd.testing.assert_frame_equal(krx_marketdata_parse_csv(fd.read(), date(2020, 1, 2)), expected)
+        checked += 1
+    print("parity with pd.read_excel: {} xls, {} of {} csv files".format(len(xls_paths), checked, len(csv_paths)))
+
+
+def mean_parse_time(func, paths, repeat=5):    # Best-of-repeat parse time per file, averaged over files
+    times = []
+    for path in paths:
+        with open(path, 'rb') as fd:
+            content = fd.read()
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(content, date(2020, 1, 2))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        times.append(best)
+    return sum(times) / len(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", default=None)
+    args = parser.parse_args()
+
+    directory = args.samples or tempfile.mkdtemp()
+    if args.samples is None:
+        synthesize_samples(directory)
+    xls_paths = sorted(glob.glob(os.path.join(directory, "*.xls")))
+    csv_paths = sorted(glob.glob(os.path.join(directory, "*.csv")))
+    check_parity(xls_paths, csv_paths)
+
+    baseline = None    # Time of the first row, so the speedups compare one set of measurements
+    print("{:<36}{:>8}{:>12}{:>10}".format("parser", "files", "ms/day", "speedup"))
+    for label, func, paths in [("xls, pd.read_excel (before)", krx_marketdata_parse_excel, xls_paths),
+                               ("xls, xlrd direct", krx_marketdata_parse_xls, xls_paths),
+                               ("csv, dedicated parser", krx_marketdata_parse_csv, csv_paths)]:
+        if not paths:
+            continue
+        elapsed = mean_parse_time(func, paths)
+        if func is krx_marketdata_parse_excel:
+            baseline = elapsed
+        speedup = "{:.1f}x".format(baseline / elapsed) if baseline else "-"
+        print("{:<36}{:>8}{:>12.1f}{:>10}".format(label, len(paths), elapsed * 1000, speedup))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# Benchmark: load a close-price panel from the columnar KRX store
+# Usage: python benchmarks/bench_krx_store.py [--years 10] [--tickers 2500] [--root /tmp/krx_store_bench]
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from equitymarketdata.store import krx_store_panel, krx_store_read, krx_store_write, store_dates    # noqa: E402
+
+
+def synthetic_day(data_date, tickers, rng):    # Frame shaped like one krx_marketdata_download result
+    n = len(tickers)
+    close = rng.integers(1000, 500000, n)
+    return pd.DataFrame({
+        'ticker': tickers,
+        'company_name': ["Company " + ticker for ticker in tickers],
+        'data_date': data_date,
+        'price_close': close,
+        'price_change': rng.integers(-1000, 1000, n),
+        'price_change_pct': rng.normal(0, 0.02, n),
+        'volume': rng.integers(0, 10**7, n),
+        'trading_value': rng.integers(0, 10**11, n),
+        'price_open': close,
+        'price_high': close,
+        'price_low': close,
+        'marketcap': close * 10**6,
+        'market_weight_pct': rng.random(n) / n,
+        'shares_issued': rng.integers(10**6, 10**9, n),
+        'foreign_shareholding': rng.integers(0, 10**8, n).astype(float),
+        'foreign_shareholding_pct': rng.random(n)
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--tickers", type=int, default=2500)
+    parser.add_argument("--root", default="/tmp/krx_store_bench")
+    args = parser.parse_args()
+
+    dates = pd.bdate_range(end="2020-12-30", periods=args.years * 250)
+    if len(store_dates(args.root)) < len(dates):
+        rng = np.random.default_rng(0)
+        tickers = ["{:06d}".format(i) for i in range(args.tickers)]
+        start = time.perf_counter()
+        for data_date in dates:
+            krx_store_write(synthetic_day(data_date, tickers, rng), args.root)
+        print("write {} dates: {:.1f}s".format(len(dates), time.perf_counter() - start))
+
+    start = time.perf_counter()
+    panel = krx_store_panel(args.root, 'price_close', dates[0].date(), dates[-1].date())
+    print("close panel {}x{}: {:.2f}s".format(panel.shape[0], panel.shape[1], time.perf_counter() - start))
+
+    start = time.perf_counter()
+    df = krx_store_read(args.root, dates[-250].date(), dates[-1].date(), tickers=["000001", "000002"], columns=['data_date', 'ticker', 'price_close', 'volume'])
+    print("1 year x 2 tickers, 4 columns ({} rows): {:.2f}s".format(len(df), time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
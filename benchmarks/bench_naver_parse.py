@@ -0,0 +1,200 @@
+# Benchmark: per-page parse time of Naver cF1001 consensus pages, the previous BeautifulSoup + read_html parser
+# (legacy_parse_html, needs beautifulsoup4) vs the lxml extractor
+# Usage: python benchmarks/bench_naver_parse.py [--samples DIR] [--pages 20]
+# DIR holds saved pages (*.html); without it pages with the layout of cF1001.aspx are synthesized
+# Before timing, naverfinance_consensus_parse is checked against fixtures/naver_cF1001_005930_Y.html
+# Limit: the fixture and the synthesized pages are hand-built to the cF1001 markup, not captured from Naver, so the
+# speedup has not been measured on real pages; pass --samples with saved pages for that
+import argparse
+import glob
+import os
+import re
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date, datetime
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from equitymarketdata.naver import ACCOUNTING_STANDARD_KEYS, FINANCIAL_ITEM_KEYS, naver_period_date, naverfinance_consensus_parse    # noqa: E402
+
+NAVER_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "naver_cF1001_005930_Y.html")
+NAVER_FIXTURE_ROWS = 6 * 8    # Items x dated columns
+# (financial_item_code, statement_period, accounting_standard, forecast_indication) -> value in ones (NaN for '-' and blanks)
+NAVER_FIXTURE_CELLS = {
+    (1100, date(2016, 12, 31), 1, 'A'): 2018667 * 10 ** 8,
+    (1100, date(2019, 12, 31), 1, 'A'): 2304009 * 10 ** 8,
+    (1300, date(2022, 12, 31), 1, 'E'): 533025 * 10 ** 8,
+    (1300, date(2023, 12, 31), 1, 'E'): np.nan,
+    (1600, date(2023, 12, 31), 1, 'E'): np.nan,
+    (4163, date(2021, 12, 31), 1, 'E'): 13.51,
+    (4165, date(2018, 12, 31), 1, 'A'): 6024.0,
+    (4501, date(2023, 12, 31), 1, 'E'): 12.47
+}
+
+
+def synthesize_page(rng, years=(2015, 2016, 2017, 2018, 2019, 2020, 2021, 2022), estimates=3):
+    # One cF1001 page: a two-row header (item column spanning both rows) and one row per financial item
+    header = []
+    for i, year in enumerate(years):
+        forecast = "(E)" if i >= len(years) - estimates else ""
+        header.append('<th scope="col" class="r02c01 bg"><span class="txt_acd">{}/12{}</span><br/>(IFRS연결)</th>'.format(year, forecast))
+    rows = []
+    for item in list(dict.fromkeys(FINANCIAL_ITEM_KEYS))[:33]:
+        cells = []
+        for _ in years:
+            value = rng.normal(0, 1e5)
+            cells.append('<td class="num">{}</td>'.format("" if rng.random() < 0.05 else "{:,.2f}".format(value)))
+        rows.append('<tr><th class="bg txt title" scope="row">{}</th>{}</tr>'.format(item, "".join(cells)))
+    return (
+        '<html><head><meta charset="utf-8"/><title>cF1001</title></head><body><div id="wrapper">'
+        '<table summary="주요재무정보" class="gHead01 all-width"><caption class="blind">주요재무정보</caption>'
+        '<colgroup><col width="130"/>' + '<col width="75"/>' * len(years) + '</colgroup>'
+        '<thead><tr><th scope="col" class="bg r01c02 endLine line-bottom" rowspan="2">주요재무정보</th>'
+        '<th scope="col" colspan="{}" class="r01c03 bg"><span>연간</span></th></tr>'.format(len(years)) +
+        '<tr>' + "".join(header) + '</tr></thead><tbody>' + "".join(rows) + '</tbody></table></div></body></html>'
+    ).encode('utf8')
+
+
+def legacy_parse_html(content, ticker, update_date):    # Previous BeautifulSoup + pd.read_html parser, the baseline
+    # Written for pandas without rowspan support in read_html: with current pandas its label shift puts each value under
+    # the period of the column before and drops the last column, and under pandas 3 the inplace replace below leaves
+    # accounting_standard unmapped
+    from bs4 import BeautifulSoup    # pip install beautifulsoup4
+    soup = BeautifulSoup(content, "lxml")    # Parsing the content (html) into lxml format
+    soup_clean = soup.prettify()    # Gets rid of tags used for formatting and spacing
+    df_consensus = pd.read_html(StringIO(soup_clean))[0]    # html table to be put into pandas dataframe format
+
+    # Code to clean up the columns into pure dates
+    length = len(df_consensus.columns)
+    formatted_column_list = [df_consensus.columns[x][1] for x in range(0, length - 1)]
+    formatted_column_list.insert(0, df_consensus.columns[0][0])
+
+    # Code to extract and format statement date/period information from column
+    statement_date_compile = re.compile(r'\d{4}\/\d{2}')    # Compile RegEx pattern to search for date items
+    statement_date = [statement_date_compile.search(column) for column in formatted_column_list]    # List comprehension to collect the date items searched in column
+    statement_date = [regex_group(item) for item in statement_date]    # List comprehension to "group" above list
+    statement_date = [str_to_datetime(item) for item in statement_date]    # List comprehension to change string into datetime format
+
+    # Code to extract and format accounting standard information from column
+    acct_standard_compile = re.compile(r'\(\D{6}\)')    # Compile RegEx pattern to search for accounting standard items
+    acct_standard = [acct_standard_compile.search(column) for column in formatted_column_list]    # List comprehension to collect the accounting standard items searched in column
+    acct_standard = [regex_group(item) for item in acct_standard]    # List comprehension to "group" above list
+    acct_standard = [regex_remove_brackets(item) for item in acct_standard]    # List comprehension to remove the brackets
+
+    # Code to extract and format forecast indication information from column
+    forecast_indication_compile = re.compile(r'\(E\)')    # Compile RegEx pattern to search for forecast indicators
+    forecast_indication = [forecast_indication_compile.search(column) for column in formatted_column_list]    # List comprehension to collect the forecast indicator items searched in column
+    forecast_indication = [regex_group(item) for item in forecast_indication]    # List comprehension to "group" above list
+    forecast_indication = [regex_remove_brackets(item) for item in forecast_indication]    # List comprehension to remove the brackets
+    forecast_indication = ['A' if item is None else item for item in forecast_indication]    # List comprehension to change None into 'A's
+
+    # Use Zip function to create a list of tuples: (fin_item_date, acct_standard, forecast_indication)
+    new_column = list(zip(statement_date, acct_standard, forecast_indication))
+
+    # Change column to multi-level column based on the list of tuples "new_column"
+    df_consensus.columns = pd.MultiIndex.from_tuples(new_column, names=('statement_period', 'accounting_standard', 'forecast_indication'))
+
+    df_consensus.set_index(df_consensus.iloc[:, 0], inplace=True)    # Set first column as index
+    df_consensus = df_consensus.loc[:, df_consensus.columns.codes[0] >= 0]    # Drop the first column (since it is already an index) and drop columns that doesn't have a column value
+    df_consensus = df_consensus.unstack()    # Unstack the dataframe (results in a series)
+    df_consensus = df_consensus.to_frame()    # Change the series into a dataframe
+    df_consensus.reset_index(inplace=True)    # Reset the index; statement items are no longer the index
+    df_consensus.columns = ['statement_period', 'accounting_standard', 'forecast_indication', 'financial_item', 'value']    # Re-name the column names with the list
+
+    # Add a column of the financial items with designated codes
+    df_consensus["financial_item_code"] = df_consensus["financial_item"].map(FINANCIAL_ITEM_KEYS)
+    new_column = df_consensus.columns.tolist()
+    new_column = new_column[:2] + new_column[-1:] + new_column[2:-1]
+    df_consensus = df_consensus[new_column]
+
+    # Convert the accounting periods with designated codes
+    df_consensus["accounting_standard"].replace(ACCOUNTING_STANDARD_KEYS, inplace=True)
+
+    # Insert ticker into the dataframe and rearrange the columns so that ticker comes first
+    df_consensus['ticker'] = ticker
+    new_column = df_consensus.columns.tolist()
+    new_column = new_column[-1:] + new_column[:-1]
+    df_consensus = df_consensus[new_column]
+
+    df_consensus["update_date"] = update_date
+
+    # Change financial item value units into ones
+    df_consensus.loc[df_consensus.financial_item_code < 4000, 'value'] = df_consensus['value'].map(lambda x: x * (10**8))
+
+    return df_consensus
+
+
+def regex_group(match):
+    return match.group() if match is not None else None
+
+
+def regex_remove_brackets(text):
+    return text.replace("(", "").replace(")", "") if isinstance(text, str) else text
+
+
+def str_to_datetime(text):    # "2020/12(E)" -> date(2020, 12, 31); labels that are not dates are returned as they are
+    try:
+        day = datetime.strptime(re.sub(r"\(E\)", "", text), '%Y/%m')
+    except (TypeError, ValueError):
+        return text
+    return naver_period_date(day.year, day.month)
+
+
+def check_fixture():    # naverfinance_consensus_parse reads the expected period, standard, forecast flag and value per cell
+    with open(NAVER_FIXTURE, 'rb') as fd:
+        df = naverfinance_consensus_parse(fd.read(), "005930", date(2021, 6, 1))
+    assert len(df) == NAVER_FIXTURE_ROWS, len(df)
+    cells = df.set_index(['financial_item_code', 'statement_period', 'accounting_standard', 'forecast_indication'])['value']
+    for key, expected in NAVER_FIXTURE_CELLS.items():
+        value = cells.loc[key]
+        assert (np.isnan(expected) and np.isnan(value)) or value == expected, (key, value, expected)
+
+
+def mean_parse_time(func, paths, repeat=5):    # Best-of-repeat parse time per page, averaged over pages
+    times = []
+    for path in paths:
+        with open(path, 'rb') as fd:
+            content = fd.read()
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(content, "005930", date(2020, 1, 2))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        times.append(best)
+    return sum(times) / len(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", default=None)
+    parser.add_argument("--pages", type=int, default=20)
+    args = parser.parse_args()
+
+    check_fixture()
+    directory = args.samples or tempfile.mkdtemp()
+    if args.samples is None:
+        rng = np.random.default_rng(0)
+        for i in range(args.pages):
+            with open(os.path.join(directory, "page{:03d}.html".format(i)), 'wb') as fd:
+                fd.write(synthesize_page(rng))
+    paths = sorted(glob.glob(os.path.join(directory, "*.html")))
+
+    warnings.simplefilter("ignore")    # read_html and inplace replace warnings of the old path
+    baseline = None    # Time of the first row, so the speedups compare one set of measurements
+    print("{:<36}{:>8}{:>12}{:>10}".format("parser", "pages", "ms/page", "speedup"))
+    for label, func in [("BeautifulSoup + read_html (before)", legacy_parse_html),
+                        ("lxml single pass", naverfinance_consensus_parse)]:
+        elapsed = mean_parse_time(func, paths)
+        baseline = baseline or elapsed
+        print("{:<36}{:>8}{:>12.2f}{:>10}".format(label, len(paths), elapsed * 1000, "{:.1f}x".format(baseline / elapsed)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Benchmark: parse throughput of recorded KRX and Naver responses in-thread vs on a ParsePool of 1/2/4/8 processes
+# Usage: python benchmarks/bench_parse_pool.py [--samples DIR] [--copies 16]
+# DIR holds saved responses (*.xls, *.csv for KRX, *.html for Naver); without it fixtures are synthesized
+# Every pool run's frames, decoded from the Arrow IPC buffers, are checked against the in-thread parse before printing
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_krx_parse import synthesize_samples    # noqa: E402
+from bench_naver_parse import NAVER_FIXTURE, synthesize_page    # noqa: E402
+from equitymarketdata.krx import krx_marketdata_parse    # noqa: E402
+from equitymarketdata.naver import naverfinance_consensus_parse    # noqa: E402
+from equitymarketdata.parsepool import ParsePool, arrow_to_frame    # noqa: E402
+
+
+def load_jobs(directory, copies):    # [(parse, content, args)] repeated `copies` times
+    jobs = []
+    for path in sorted(glob.glob(os.path.join(directory, "*"))):
+        with open(path, 'rb') as fd:
+            content = fd.read()
+        extension = os.path.splitext(path)[1]
+        if extension in ('.xls', '.csv'):
+            jobs.append((krx_marketdata_parse, content, (date(2020, 1, 2), extension[1:])))
+        elif extension == '.html':
+            jobs.append((naverfinance_consensus_parse, content, ("005930", date(2020, 1, 2))))
+    return jobs * copies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", default=None)
+    parser.add_argument("--copies", type=int, default=16)
+    args = parser.parse_args()
+
+    directory = args.samples or tempfile.mkdtemp()
+    if args.samples is None:
+        synthesize_samples(directory)
+        rng = np.random.default_rng(0)
+        for i in range(4):
+            with open(os.path.join(directory, "page{}.html".format(i)), 'wb') as fd:
+                fd.write(synthesize_page(rng))
+        shutil.copy(NAVER_FIXTURE, directory)    # Blank and '-' cells
+    jobs = load_jobs(directory, args.copies)
+
+    start = time.perf_counter()
+    expected = [parse(content, *parse_args) for parse, content, parse_args in jobs]
+    baseline = time.perf_counter() - start
+    print("{} responses, {} cores".format(len(jobs), os.cpu_count()))
+    print("{:<16}{:>12}{:>14}{:>10}".format("mode", "seconds", "responses/s", "speedup"))
+    print("{:<16}{:>12.2f}{:>14.1f}{:>10}".format("in-thread", baseline, len(jobs) / baseline, "1.0x"))
+    for workers in [1, 2, 4, 8]:
+        with ParsePool(workers) as pool:
+            pool.parse(*jobs[0][:2], *jobs[0][2])    # Start the workers outside the timing
+            start = time.perf_counter()
+            futures = [pool.submit(parse, content, *parse_args) for parse, content, parse_args in jobs]
+            frames = [arrow_to_frame(future.result()) for future in futures]
+            elapsed = time.perf_counter() - start
+        for frame, df in zip(frames, expected):
+            pd.testing.assert_frame_equal(frame, df)
+        print("{:<16}{:>12.2f}{:>14.1f}{:>10}".format("{} processes".format(workers), elapsed, len(jobs) / elapsed, "{:.1f}x".format(baseline / elapsed)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# equitymarketdata: download and scraping helpers for KRX market data and Naver Finance consensus
+# Importing the package is cheap and has no side effects: the names below load their module (and pandas, numpy,
+# sqlalchemy, ...) on first access, and no connection is opened until a function that needs one is called
+import importlib
+
+_EXPORTS = {
+    'load_config': 'equitymarketdata.config',
+    'create_sqlengine': 'equitymarketdata.db',
+    'execute_sql_file': 'equitymarketdata.db',
+    'create_session': 'equitymarketdata.httpclient',
+    'ResponseCache': 'equitymarketdata.cache',
+    'krx_marketdata_download': 'equitymarketdata.krx',
+    'krx_marketdata_fetch': 'equitymarketdata.krx',
+    'krx_marketdata_parse': 'equitymarketdata.krx',
+    'krx_pipeline': 'equitymarketdata.pipeline',
+    'krx_sync': 'equitymarketdata.sync',
+    'krx_reconcile': 'equitymarketdata.reconcile',
+    'krx_trading_calendar': 'equitymarketdata.tradingcalendar',
+    'krx_derived_update': 'equitymarketdata.analytics',
+    'naverfinance_consensus_fetch': 'equitymarketdata.naver',
+    'naverfinance_consensus_parse': 'equitymarketdata.naver',
+    'naverfinance_consensus_batch': 'equitymarketdata.scraper',
+    'MarketDataQuery': 'equitymarketdata.query',
+    'ConsensusRevisionIndex': 'equitymarketdata.revisions',
+    'RunMetrics': 'equitymarketdata.timing'
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError("module 'equitymarketdata' has no attribute " + repr(name))
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value    # Later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
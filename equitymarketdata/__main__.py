@@ -0,0 +1,5 @@
+import sys
+
+from equitymarketdata.cli import main
+
+sys.exit(main())
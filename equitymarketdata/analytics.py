@@ -0,0 +1,139 @@
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from equitymarketdata.store import KRX_STORE_SCHEMA, long_to_panels, store_dates, store_read, store_write
+
+
+# Derived daily figures per ticker, stored like the snapshots: one Parquet file per data_date
+KRX_DERIVED_SCHEMA = pa.schema([
+    ('ticker', pa.dictionary(pa.int32(), pa.string())),
+    ('data_date', pa.date32()),
+    ('return_1d', pa.float64()),    # Close-to-close return against KRX's adjusted base price (price_close - price_change)
+    ('price_index', pa.float64()),    # Cumulative product of (1 + return_1d), starting at 1.0 on the first stored day
+    ('share_change', pa.int8()),    # 1 when shares_issued differs from the previous trading day (split, issue, buyback)
+    ('volatility_20d', pa.float32()),    # Annualized standard deviation of the last 20 daily returns
+    ('turnover', pa.float32()),    # volume / shares_issued
+    ('foreign_delta', pa.float64()),    # Change in foreign_shareholding from the previous trading day
+    ('foreign_pct_delta', pa.float32())    # Change in foreign_shareholding_pct from the previous trading day
+])
+KRX_DERIVED_INPUTS = ['price_close', 'price_change', 'volume', 'shares_issued', 'foreign_shareholding', 'foreign_shareholding_pct']
+VOLATILITY_WINDOW = 20
+VOLATILITY_MIN_PERIODS = 15
+HISTORY_DAYS = 60    # Calendar days of snapshots read before the first new date; covers VOLATILITY_WINDOW trading days
+
+
+def krx_derived_compute(panels, seed=None):
+    # Derived figures as wide DataFrames (data_date x ticker) from input panels {field: DataFrame} sharing one index
+    # seed (data_date, Series of price_index by ticker) makes price_index continue from values stored for that date
+    close = panels['price_close'].to_numpy()
+    change = panels['price_change'].to_numpy()
+    shares = panels['shares_issued'].to_numpy()
+    foreign = panels['foreign_shareholding'].to_numpy()
+    foreign_pct = panels['foreign_shareholding_pct'].to_numpy()
+    index, columns = panels['price_close'].index, panels['price_close'].columns
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        base = close - change    # KRX quotes the change against the base price, which already reflects corporate actions
+        return_1d = np.where(base > 0, change / base, np.nan)
+        turnover = panels['volume'].to_numpy() / np.where(shares > 0, shares, np.nan)
+
+    def previous(values):    # Row shifted down by one trading day
+        shifted = np.full_like(values, np.nan)
+        shifted[1:] = values[:-1]
+        return shifted
+
+    previous_shares = previous(shares)
+    share_change = ((shares != previous_shares) & ~np.isnan(shares) & ~np.isnan(previous_shares)).astype('int8')
+
+    growth = np.where(np.isnan(return_1d), 1.0, 1.0 + return_1d)    # Days without a return carry the index unchanged
+    growth[0] = 1.0
+    price_index = np.cumprod(growth, axis=0)
+    if seed is not None:
+        position = index.get_loc(seed[0])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = seed[1].reindex(columns).to_numpy(dtype='float64') / price_index[position]
+        price_index *= np.where(np.isnan(scale), 1.0, scale)
+    price_index[np.isnan(close)] = np.nan
+
+    df_return = pd.DataFrame(return_1d, index=index, columns=columns)
+    volatility = df_return.rolling(VOLATILITY_WINDOW, min_periods=VOLATILITY_MIN_PERIODS).std() * np.sqrt(252)
+    return {
+        'return_1d': df_return,
+        'price_index': pd.DataFrame(price_index, index=index, columns=columns),
+        'share_change': pd.DataFrame(share_change, index=index, columns=columns),
+        'volatility_20d': volatility,
+        'turnover': pd.DataFrame(turnover, index=index, columns=columns),
+        'foreign_delta': pd.DataFrame(foreign - previous(foreign), index=index, columns=columns),
+        'foreign_pct_delta': pd.DataFrame(foreign_pct - previous(foreign_pct), index=index, columns=columns)
+    }
+
+
+def krx_derived_write(derived, close, root, dates, max_workers=4):
+    # Write the rows of `dates` (tickers with a close that day) as date partitions
+    # Tables are built straight from the arrays with one shared ticker dictionary and written on max_workers threads
+    # (Parquet encoding and compression release the GIL)
+    dictionary = pa.array(np.asarray(close.columns, dtype=object), type=pa.string())
+    close_values = close.to_numpy()
+    values = {field: derived[field].to_numpy() for field in KRX_DERIVED_SCHEMA.names[2:]}
+
+    def write_date(data_date, i):
+        present = np.flatnonzero(~np.isnan(close_values[i]))
+        arrays = [pa.DictionaryArray.from_arrays(pa.array(present, type=pa.int32()), dictionary),
+                  pa.array(np.full(len(present), np.datetime64(data_date, 'D')), type=pa.date32())]
+        for field in KRX_DERIVED_SCHEMA.names[2:]:
+            column = values[field][i][present]
+            arrays.append(pa.array(column, type=KRX_DERIVED_SCHEMA.field(field).type, from_pandas=True))
+        store_write(pa.Table.from_arrays(arrays, schema=KRX_DERIVED_SCHEMA), root, data_date, KRX_DERIVED_SCHEMA)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(write_date, dates, close.index.get_indexer(dates)))
+
+
+def krx_derived_update(store_path, derived_root, end=None, full=False):
+    # Compute derived figures for the snapshot dates in store_path that derived_root does not have yet
+    # Only HISTORY_DAYS of snapshots before the first new date are read; full=True recomputes everything
+    # Returns the list of dates written
+    derived_dates = [] if full else store_dates(derived_root, end=end)
+    last = derived_dates[-1] if derived_dates else None
+    new_dates = store_dates(store_path, None if last is None else last + timedelta(1), end)
+    if not new_dates:
+        return []
+    start = None if last is None else min(last, new_dates[0] - timedelta(HISTORY_DAYS))
+    table = store_read(store_path, KRX_STORE_SCHEMA, start, new_dates[-1], columns=['data_date', 'ticker'] + KRX_DERIVED_INPUTS)
+    panels = long_to_panels(table.to_pandas(), KRX_DERIVED_INPUTS)
+
+    seed = None
+    if last is not None and last in panels['price_close'].index:    # price_index carries on from the last derived day
+        df_seed = store_read(derived_root, KRX_DERIVED_SCHEMA, last, last, columns=['ticker', 'price_index']).to_pandas()
+        seed = (last, pd.Series(df_seed['price_index'].to_numpy(), index=df_seed['ticker'].to_numpy(dtype=object)))
+    derived = krx_derived_compute(panels, seed)
+    krx_derived_write(derived, panels['price_close'], derived_root, new_dates)
+    return new_dates
+
+
+def krx_derived_read(derived_root, start=None, end=None, tickers=None, columns=None):    # Long-format DataFrame of derived figures
+    return store_read(derived_root, KRX_DERIVED_SCHEMA, start, end, tickers, columns).to_pandas()
+
+
+def main(argv=None):    # python -m equitymarketdata.analytics --store krx_store --derived krx_derived [--full]
+    parser = argparse.ArgumentParser(description="Update derived KRX figures from the Parquet store")
+    parser.add_argument("--store", required=True, help="Parquet store of KRX snapshots")
+    parser.add_argument("--derived", required=True, help="Parquet dataset of derived figures")
+    parser.add_argument("--full", action="store_true", help="recompute every date")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    dates = krx_derived_update(args.store, args.derived, full=args.full)
+    print("{} dates derived in {:.1f}s".format(len(dates), time.perf_counter() - start))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from equitymarketdata.dates import to_date
+from equitymarketdata.httpclient import create_session, retry_call
+from equitymarketdata.krx import krx_marketdata_fetch, krx_marketdata_parse
+
+
+# Fixed-date days on which KRX is closed: (month, day, first year the closure applies)
+KRX_FIXED_HOLIDAYS = [
+    (1, 1, 0),      # New Year's Day
+    (3, 1, 0),      # Independence Movement Day
+    (5, 1, 0),      # Labor Day (exchange closed)
+    (5, 5, 0),      # Children's Day
+    (6, 6, 0),      # Memorial Day
+    (8, 15, 0),     # Liberation Day
+    (10, 3, 0),     # National Foundation Day
+    (10, 9, 2013),  # Hangul Day (public holiday again from 2013)
+    (12, 25, 0),    # Christmas
+    (12, 31, 0)     # Year-end closing
+]
+
+
+def krx_is_known_closed(data_date, holidays=None):
+    # True for weekends, fixed-date KRX holidays and any date in `holidays` (e.g. lunar holidays, elections)
+    day = to_date(data_date)
+    if day.weekday() >= 5:
+        return True
+    if holidays is not None and day in holidays:
+        return True
+    for month, dom, since in KRX_FIXED_HOLIDAYS:
+        if day.month == month and day.day == dom and day.year >= since:
+            return True
+    return False
+
+
+def _krx_backfill_day(data_date, session, fetch, parse, retries, backoff):
+    content = retry_call(fetch, data_date.strftime('%Y%m%d'), session=session, retries=retries, backoff=backoff)
+    return parse(content, data_date)
+
+
+def krx_backfill(dates, max_workers=4, rate_limit=None, retries=3, backoff=1.0, holidays=None, session=None,
+                 fetch=krx_marketdata_fetch, parse=krx_marketdata_parse, cache=None, filetype='xls', calendar=None):
+    # Download a range of dates with up to max_workers concurrent requests over one keep-alive session
+    # Yields (data_date, df) in the order of `dates`; df is None for days known to be closed (no request is made)
+    # rate_limit caps requests per second per host; failed days are retried `retries` times with exponential backoff
+    # cache (a ResponseCache) serves dates downloaded before without any request
+    # filetype ('xls' or 'csv') is passed to both fetch and parse
+    # calendar (a TradingCalendar) replaces the weekend/holiday rules when deciding which days are closed
+    fetch = partial(fetch, filetype=filetype)
+    parse = partial(parse, filetype=filetype)
+    if cache is not None:
+        fetch = partial(fetch, cache=cache)
+    if session is None:
+        session = create_session(pool_size=max_workers, rate_limit=rate_limit)
+    window = max_workers * 2    # Bound on days in flight or finished but not yet yielded
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for data_date in dates:
+            if (not calendar.is_trading_day(data_date)) if calendar is not None else krx_is_known_closed(data_date, holidays):
+                pending.append((data_date, None))
+            else:
+                pending.append((data_date, executor.submit(_krx_backfill_day, data_date, session, fetch, parse, retries, backoff)))
+
+            # Commit results in date order; block on the oldest day only when the window is full
+            while pending and (pending[0][1] is None or pending[0][1].done() or len(pending) >= window):
+                head_date, future = pending.popleft()
+                yield head_date, None if future is None else future.result()
+
+        while pending:
+            head_date, future = pending.popleft()
+            yield head_date, None if future is None else future.result()
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class ResponseCache:
+    # On-disk cache of raw HTTP responses
+    # keys/<request hash>.json holds metadata and points at objects/<content hash>, so identical bodies
+    # (e.g. the empty file of every holiday) are stored once
+    # Entries with ttl=None never expire; the least recently used entries are evicted above max_bytes
+    def __init__(self, root, max_bytes=2 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(root, "keys"), exist_ok=True)
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self.total_bytes = sum(os.path.getsize(path) for path in self._object_paths())
+
+    @staticmethod
+    def key(endpoint, params):    # Stable key for a request: endpoint plus parameters in sorted order
+        request = json.dumps([endpoint, sorted((str(k), str(v)) for k, v in params.items())], ensure_ascii=False)
+        return hashlib.sha256(request.encode('utf8')).hexdigest()
+
+    def _key_path(self, key):
+        return os.path.join(self.root, "keys", key[:2], key + ".json")
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def _object_paths(self):
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, "objects")):
+            for name in filenames:
+                if not name.endswith(".tmp"):
+                    yield os.path.join(dirpath, name)
+
+    @staticmethod
+    def _write_atomic(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = "{}.{}.tmp".format(path, threading.get_ident())
+        with open(tmp, 'wb') as fd:
+            fd.write(data)
+        os.replace(tmp, path)
+
+    def get(self, key, now=None):    # (content, meta) for a cached response, or None; meta['fresh'] tells if it has expired
+        try:
+            with open(self._key_path(key), 'rb') as fd:
+                meta = json.loads(fd.read())
+            with open(self._object_path(meta['object']), 'rb') as fd:
+                content = fd.read()
+        except (OSError, ValueError):
+            return None
+        now = time.time() if now is None else now
+        meta['fresh'] = meta['expires'] is None or meta['expires'] > now
+        try:
+            os.utime(self._key_path(key))    # Mark as recently used for eviction
+        except OSError:
+            pass    # Evicted by another thread since the read; the content is still good
+        return content, meta
+
+    def put(self, key, content, ttl=None, etag=None, last_modified=None):
+        digest = hashlib.sha256(content).hexdigest()
+        object_path = self._object_path(digest)
+        meta = {
+            'object': digest,
+            'stored': time.time(),
+            'expires': None if ttl is None else time.time() + ttl,
+            'etag': etag,
+            'last_modified': last_modified
+        }
+        # Object and key are written under the lock, so evict never sees an object whose key is not linked yet
+        with self.lock:
+            if not os.path.exists(object_path):
+                self._write_atomic(object_path, content)
+                self.total_bytes += len(content)
+            self._write_atomic(self._key_path(key), json.dumps(meta).encode('utf8'))
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def refresh(self, key, ttl):    # Extend an entry after the server confirmed it unchanged (HTTP 304)
+        cached = self.get(key)
+        if cached is not None:
+            content, meta = cached
+            self.put(key, content, ttl=ttl, etag=meta['etag'], last_modified=meta['last_modified'])
+
+    def evict(self):    # Drop least recently used entries until the cache is below 90% of max_bytes
+        with self.lock:
+            keys = []
+            for dirpath, _, filenames in os.walk(os.path.join(self.root, "keys")):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        keys.append((os.path.getmtime(path), path))
+                    except OSError:
+                        pass
+            keys.sort()
+            referenced = {}
+            for _, path in keys:
+                try:
+                    with open(path, 'rb') as fd:
+                        referenced[path] = json.loads(fd.read())['object']
+                except (OSError, ValueError):
+                    referenced[path] = None
+            sizes = {}
+            for object_path in self._object_paths():
+                sizes[os.path.basename(object_path)] = os.path.getsize(object_path)
+            users = {}
+            for digest in referenced.values():
+                users[digest] = users.get(digest, 0) + 1
+
+            total = sum(sizes.values())
+            target = self.max_bytes * 0.9
+            for _, path in keys:
+                if total <= target:
+                    break
+                digest = referenced[path]
+                os.remove(path)
+                users[digest] = users.get(digest, 1) - 1
+                if users[digest] == 0 and digest in sizes:
+                    os.remove(self._object_path(digest))
+                    total -= sizes.pop(digest)
+            for digest in [digest for digest in sizes if users.get(digest, 0) == 0]:    # Objects left behind by interrupted writes
+                os.remove(self._object_path(digest))
+                total -= sizes.pop(digest)
+            self.total_bytes = total
@@ -0,0 +1,33 @@
+import importlib
+import sys
+
+
+# Subcommand -> module whose main(argv) runs it; modules are imported only when their command runs
+COMMANDS = {
+    'krx-download': ('equitymarketdata.krxdownload', "interactive KRX download for a range of dates"),
+    'naver-consensus': ('equitymarketdata.naverconsensus', "interactive Naver Finance consensus scrape"),
+    'sync': ('equitymarketdata.sync', "incremental KRX sync for cron"),
+    'pipeline': ('equitymarketdata.pipeline', "KRX backfill of a date range"),
+    'reconcile': ('equitymarketdata.reconcile', "verify and repair stored KRX data"),
+    'derive': ('equitymarketdata.analytics', "update derived KRX figures from the Parquet store"),
+    'revisions': ('equitymarketdata.revisions', "import, compact and query the consensus revision store"),
+    'replay': ('equitymarketdata.replay', "record live responses or serve a recording")
+}
+
+
+def usage():
+    lines = ["usage: equitymarketdata <command> [options]    (or python -m equitymarketdata)", "", "commands:"]
+    lines += ["  {:<18}{}".format(command, description) for command, (_, description) in COMMANDS.items()]
+    lines += ["", "Settings and credentials: equitymarketdata.ini or EQUITYMARKETDATA_* environment variables (see equitymarketdata.config)"]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return 0
+    if argv[0] not in COMMANDS:
+        print("unknown command: " + argv[0] + "\n\n" + usage(), file=sys.stderr)
+        return 2
+    return importlib.import_module(COMMANDS[argv[0]][0]).main(argv[1:]) or 0
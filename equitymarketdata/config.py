@@ -0,0 +1,75 @@
+import configparser
+import os
+
+
+CONFIG_ENV = "EQUITYMARKETDATA_CONFIG"    # Path of the config file; default CONFIG_FILE in the working directory, if present
+CONFIG_FILE = "equitymarketdata.ini"
+ENV_PREFIX = "EQUITYMARKETDATA_"    # EQUITYMARKETDATA_<SECTION>_<KEY> overrides [section] key, e.g. EQUITYMARKETDATA_SQL_PASSWORD
+
+# Every setting with its default; values are strings as in the ini file
+CONFIG_DEFAULTS = {
+    'sql': {
+        'url': '',    # Full SQLAlchemy URL; built from the parts below when empty
+        'driver': 'mysql+mysqldb',
+        'host': 'localhost',
+        'port': '',
+        'user': '',
+        'password': '',
+        'schema': 'marketdata',
+        'pool_size': '5',    # Connections kept open per engine; at least the number of threads writing at once
+        'pool_recycle': '3600'    # Seconds before a pooled connection is replaced (MySQL drops idle ones after wait_timeout)
+    },
+    'paths': {
+        'cache': 'response_cache',    # Raw KRX files and Naver pages; empty to download everything
+        'calendar': 'trading_calendar.json',
+        'store': '',    # Date-partitioned Parquet store written next to SQL; empty for SQL only
+        'derived': '',    # Derived figures updated from the store; empty to skip
+        'revisions': '',    # Consensus revision store appended by the Naver scrape; empty to skip
+        'events': '',    # JSON-lines event log of each run; empty to skip
+        'metrics': '',    # Prometheus text file written at the end of each run; empty to skip
+        'krx_init_sql': '',    # .sql files run before the KRX download (e.g. krx_tradingdata_createtable.sql), comma-separated
+        'naver_init_sql': ''    # .sql files run before the Naver scrape (accounting_standard_keys.sql, financial_item_keys.sql, ...)
+    },
+    'krx': {
+        'workers': '4',    # Days downloaded at the same time
+        'rate_limit': '4',    # Maximum requests per second to each KRX host
+        'filetype': 'xls',    # 'xls' or 'csv'; the csv download parses several times faster
+        'write_method': 'executemany',    # 'executemany', 'load_data' (needs local_infile enabled) or 'to_sql'
+        'parse_workers': '0'    # Parser processes; 0 parses in a thread
+    },
+    'naver': {
+        'workers': '4',    # Pages scraped at the same time
+        'rate_limit': '2',    # Maximum requests per second to Naver Finance
+        'periods': 'Y',    # Y (yearly) and/or Q (quarterly), comma-separated
+        'statement_types': '0',    # 0 main, 1 K-GAAP standalone, 2 K-GAAP consolidated, 3 K-IFRS standalone, 4 K-IFRS consolidated
+        'parse_workers': '0'
+    }
+}
+
+
+def load_config(path=None, environ=None):
+    # ConfigParser with CONFIG_DEFAULTS, overridden by the ini file (path, $EQUITYMARKETDATA_CONFIG or ./equitymarketdata.ini)
+    # and then by EQUITYMARKETDATA_<SECTION>_<KEY> environment variables; nothing is connected or created
+    environ = os.environ if environ is None else environ
+    config = configparser.ConfigParser(interpolation=None)
+    config.read_dict(CONFIG_DEFAULTS)
+    path = path or environ.get(CONFIG_ENV)
+    if path is not None:
+        with open(path, 'r', encoding='UTF8') as fd:    # A file that was asked for must exist
+            config.read_file(fd)
+    elif os.path.exists(CONFIG_FILE):
+        config.read(CONFIG_FILE, encoding='UTF8')
+    for section in config.sections():
+        for key in config[section]:
+            name = ENV_PREFIX + section.upper() + "_" + key.upper()
+            if name in environ:
+                config[section][key] = environ[name]
+    return config
+
+
+def config_path(value):    # None for an empty setting
+    return value or None
+
+
+def config_list(value):    # ['a', 'b'] from "a, b" (or one item per line)
+    return [item.strip() for item in value.replace("\n", ",").split(",") if item.strip()]
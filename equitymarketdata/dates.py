@@ -0,0 +1,8 @@
+# Date normalisation shared by the download, sync, calendar and query modules
+# Imports nothing from the package, so krx and backfill can both use it without an import cycle
+
+
+def to_date(data_date):
+    # datetime.date from a date, datetime or pandas Timestamp (krx_pipeline gets pd.date_range), so data_date is stored
+    # as 'YYYY-MM-DD' by every writer; SQLite would keep a Timestamp as '2020-01-02 00:00:00'
+    return data_date.date() if hasattr(data_date, 'hour') else data_date
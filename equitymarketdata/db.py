@@ -0,0 +1,60 @@
+import threading
+
+from equitymarketdata.config import load_config
+
+
+_ENGINES = {}    # (url, options) -> engine, shared by every caller in the process
+_ENGINES_LOCK = threading.Lock()
+
+
+def sql_url(config):    # SQLAlchemy URL from the [sql] section of a config
+    section = config['sql']
+    if section['url']:
+        return section['url']
+    from sqlalchemy.engine import URL    # Escapes special characters in the password
+    return URL.create(section['driver'], username=section['user'] or None, password=section['password'] or None,
+                      host=section['host'] or None, port=int(section['port']) if section['port'] else None,
+                      database=section['schema'] or None,
+                      query={'charset': 'utf8'} if section['driver'].startswith('mysql') else {}).render_as_string(hide_password=False)
+
+
+def create_sqlengine(url=None, config=None, **kwargs):
+    # Pooled engine for url (default: from config, or load_config()), created once per process and shared by its callers
+    # Creating it does not connect; connections are opened on first use, checked before reuse (pool_pre_ping) and
+    # recycled after pool_recycle seconds. kwargs go to sqlalchemy.create_engine
+    from sqlalchemy import create_engine
+    config = load_config() if config is None else config
+    url = sql_url(config) if url is None else url
+    options = {}
+    if not str(url).startswith('sqlite'):
+        options = {'pool_pre_ping': True, 'pool_size': config['sql'].getint('pool_size'), 'pool_recycle': config['sql'].getint('pool_recycle')}
+    options.update(kwargs)
+    key = (str(url), tuple(sorted((name, repr(value)) for name, value in options.items())))
+    with _ENGINES_LOCK:
+        if key not in _ENGINES:
+            _ENGINES[key] = create_engine(url, **options)
+        return _ENGINES[key]
+
+
+def execute_sql_file(sqlengine, filename):
+    # Run the ;-separated statements of a .sql file on one connection
+    # Operational and integrity errors are reported and skipped, e.g. DROP TABLE of a table that does not exist yet
+    with open(filename, 'r', encoding='UTF8') as fd:
+        sql_commands = fd.read().split(';')
+    dbapi = sqlengine.dialect.dbapi
+    connection = sqlengine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for command in sql_commands:
+            if not command.strip():
+                continue
+            try:
+                cursor.execute(command)
+            except dbapi.OperationalError:
+                print("Operational Error. Execution passed.")
+            except dbapi.IntegrityError:
+                print("Integrity Error. Execution passed.")
+        cursor.close()
+        connection.commit()
+    finally:
+        connection.close()
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+
+# Columns compared when deciding whether a consensus row is new or changed (everything but update_date)
+DIFF_COLUMNS = ['ticker', 'statement_period', 'financial_item', 'financial_item_code', 'value', 'accounting_standard', 'forecast_indication']
+NUMERIC_DIFF_COLUMNS = ['financial_item_code', 'value', 'accounting_standard']
+
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+NULL_HASH = np.uint64(0x5BD1E9955BD1E995)
+
+
+def _column_hash(series, column, numeric_columns=NUMERIC_DIFF_COLUMNS):    # uint64 hash per value, normalized so that SQL and freshly parsed frames hash alike
+    if column in numeric_columns:
+        values = pd.to_numeric(series, errors='coerce').to_numpy(dtype='float64') + 0.0    # + 0.0 turns -0.0 into 0.0
+        values[np.isnan(values)] = np.nan    # One NaN bit pattern, so missing values compare equal like in drop_duplicates
+        return pd.util.hash_array(values)
+
+    # Object columns: hash each distinct value once and broadcast through the factorized codes
+    codes, uniques = pd.factorize(series.to_numpy(dtype=object))
+    if column == 'statement_period':
+        uniques = np.asarray(uniques, dtype='datetime64[D]').view('int64')    # date, datetime and Timestamp all compare equal
+    else:
+        uniques = np.asarray(uniques, dtype=object)
+    unique_hash = np.append(pd.util.hash_array(uniques, categorize=False), NULL_HASH)
+    return unique_hash[codes]    # Missing values have code -1 and pick NULL_HASH
+
+
+def row_hash(df, columns, numeric_columns=NUMERIC_DIFF_COLUMNS):    # One uint64 per row over the composite key of `columns`
+    hashes = np.zeros(len(df), dtype='uint64')
+    with np.errstate(over='ignore'):
+        for column in columns:
+            hashes = hashes * HASH_MULTIPLIER ^ _column_hash(df[column], column, numeric_columns)
+    return hashes
+
+
+def consensus_row_hash(df, columns=DIFF_COLUMNS):
+    return row_hash(df, columns)
+
+
+def sorted_row_hash(df):    # Sorted row hashes of existing rows, computed once and reused by every consensus_diff call
+    return np.sort(consensus_row_hash(df))
+
+
+def consensus_diff(df_consensus, df_consensus_existing_latest=None, existing_hash=None):
+    # Rows of df_consensus that are new or changed compared to the latest existing rows
+    # Both frames may hold any number of tickers, so a whole batch is diffed in one call
+    # existing_hash (from sorted_row_hash) replaces df_consensus_existing_latest when diffing many tickers against one preload
+    if existing_hash is None:
+        existing_hash = sorted_row_hash(df_consensus_existing_latest)
+    new_hash = consensus_row_hash(df_consensus)
+    position = np.minimum(np.searchsorted(existing_hash, new_hash), max(len(existing_hash) - 1, 0))
+    keep = np.ones(len(new_hash), dtype=bool) if len(existing_hash) == 0 else existing_hash[position] != new_hash
+    keep &= ~pd.Series(new_hash).duplicated().to_numpy()    # Write a row repeated within the new snapshot only once
+
+    df_consensus_sql = df_consensus[keep].copy()
+    df_consensus_sql['statement_period'] = pd.to_datetime(df_consensus_sql['statement_period'])
+    return df_consensus_sql
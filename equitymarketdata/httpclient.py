@@ -0,0 +1,62 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class RateLimiter:    # Spaces out requests to the same host so that at most `rate` requests per second are sent
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_slot = {}    # host -> earliest time the next request may be sent
+        self.lock = threading.Lock()
+
+    def wait(self, host):
+        if self.interval == 0.0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class RateLimitedSession(requests.Session):    # requests.Session that waits on a per-host RateLimiter before every request
+    def __init__(self, rate_limiter=None):
+        super().__init__()
+        self.rate_limiter = rate_limiter
+
+    def request(self, method, url, *args, **kwargs):
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait(urlsplit(url).netloc)
+        return super().request(method, url, *args, **kwargs)
+
+
+def create_session(pool_size=10, rate_limit=None):
+    # Shared keep-alive session; pool_size should be at least the number of worker threads using it
+    session = RateLimitedSession(RateLimiter(rate_limit) if rate_limit else None)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def retry_call(func, *args, retries=3, backoff=1.0, exceptions=(requests.RequestException,), timer=None, **kwargs):
+    # Call func, retrying on the given exceptions with exponential backoff (plus jitter) between attempts
+    # timer (a StageTimer) counts 'retries' and 'retries_exhausted' and gets a 'retry' event per failed attempt
+    attempt = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except exceptions as e:
+            if timer is not None:
+                timer.count('retries_exhausted' if attempt >= retries else 'retries')
+                timer.event('retry', call=getattr(getattr(func, 'func', func), '__name__', repr(func)), args=args, attempt=attempt, error=repr(e))
+            if attempt >= retries:
+                raise
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random() * 0.1))
+            attempt += 1
@@ -0,0 +1,207 @@
+from io import BytesIO
+from datetime import datetime
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import requests
+import xlrd
+
+from equitymarketdata.dates import to_date
+from equitymarketdata.timing import NULL_TIMER
+
+
+KRX_OTP_URL = "http://marketdata.krx.co.kr/contents/COM/GenerateOTP.jspx"
+KRX_DOWNLOAD_URL = "http://file.krx.co.kr/download.jspx"
+
+KRX_CACHE_RECENT_DAYS = 7    # Files of dates this recent may still change (e.g. foreign ownership is filled in late)
+KRX_CACHE_RECENT_TTL = 6 * 60 * 60    # Seconds a recent date's file is reused before downloading it again
+KRX_CACHE_CHECK_DAYS = 1    # Files of dates from today - KRX_CACHE_CHECK_DAYS on are cached only once complete
+
+# Change column names to English
+KRX_COLUMNS = {
+    '종목코드': 'ticker',
+    '종목명': 'company_name',
+    '현재가': 'price_close',
+    '대비': 'price_change',
+    '등락률': 'price_change_pct',
+    '거래량': 'volume',
+    '거래대금': 'trading_value',
+    '시가': 'price_open',
+    '고가': 'price_high',
+    '저가': 'price_low',
+    '시가총액': 'marketcap',
+    '시가총액비중(%)': 'market_weight_pct',
+    '상장주식수(천주)': 'shares_issued',    # Actual data is not in thousands
+    '외국인 보유주식수': 'foreign_shareholding',
+    '외국인 지분율(%)': 'foreign_shareholding_pct'
+}
+KRX_TEXT_COLUMNS = ['ticker', 'company_name']
+KRX_PCT_COLUMNS = ['price_change_pct', 'market_weight_pct', 'foreign_shareholding_pct']
+
+
+def krx_cache_ttl(date_str, today=None):    # None (never expires) for finalized past dates, a short TTL for recent ones
+    today = datetime.today() if today is None else today
+    if datetime.strptime(date_str, '%Y%m%d') < today - timedelta(KRX_CACHE_RECENT_DAYS):
+        return None
+    return KRX_CACHE_RECENT_TTL
+
+
+def krx_cache_complete(content, date_str, filetype='xls', today=None):
+    # False for a file of a date >= today - KRX_CACHE_CHECK_DAYS that is empty or has no foreign ownership yet, so an
+    # early download is not reused for KRX_CACHE_RECENT_TTL; files of older dates are not parsed
+    today = datetime.today() if today is None else today
+    if datetime.strptime(date_str, '%Y%m%d').date() < (today - timedelta(KRX_CACHE_CHECK_DAYS)).date():
+        return True
+    if len(content.strip()) == 0:
+        return False
+    try:
+        df = krx_marketdata_parse(content, filetype=filetype)
+    except ValueError:
+        return False
+    if df.empty or 'foreign_shareholding' not in df.columns:
+        return False
+    return bool(np.nansum(df['foreign_shareholding'].to_numpy(dtype='float64', na_value=np.nan)) > 0)
+
+
+def krx_marketdata_fetch(date_str, session=None, otp_url=KRX_OTP_URL, down_url=KRX_DOWNLOAD_URL, cache=None, filetype='xls', timer=None):
+    # Raw file bytes of KRX market data for date_str ('%Y%m%d'); timer (a StageTimer) times the 'otp' and 'download' calls
+    http = session if session is not None else requests    # Reuse keep-alive connections when a session is given
+    timer = timer if timer is not None else NULL_TIMER
+
+    # Generate OTP from KRX Marketdata
+    gen_otp_data = {
+        "name": "fileDown",
+        "filetype": filetype,    # 'xls' or 'csv'; csv parses fastest
+        "url": "MKD/04/0404/04040200/mkd04040200_01",
+        "market_gubun": "ALL",
+        "indx_ind_cd": "",
+        "sect_tp_cd": "",
+        "schdate": date_str,
+        "pagePath": "/contents/MKD/04/0404/04040200/MKD04040200.jsp"
+    }
+
+    # The OTP is single-use, so the cache is keyed on the request it was generated for and a hit skips both calls
+    if cache is not None:
+        cache_key = cache.key(down_url, gen_otp_data)
+        cached = cache.get(cache_key)
+        if cached is not None and cached[1]['fresh']:
+            timer.count('cache_hits')
+            return cached[0]
+
+    with timer.time('otp'):
+        r = http.post(otp_url, gen_otp_data)
+        r.raise_for_status()
+    code = r.content
+
+    # Download market data
+    down_data = {
+        "code": code
+    }
+
+    with timer.time('download'):
+        r = http.post(down_url, down_data)
+        r.raise_for_status()
+    if cache is not None:
+        if krx_cache_complete(r.content, date_str, filetype):
+            cache.put(cache_key, r.content, ttl=krx_cache_ttl(date_str))
+        else:
+            timer.count('cache_incomplete')
+    return r.content
+
+
+def krx_marketdata_parse_excel(content, data_date=None):    # Generic pd.read_excel path; fallback for files xlrd cannot open
+    df = pd.read_excel(BytesIO(content), header=0, thousands=',', converters={'종목코드': str})
+    df.rename(columns=KRX_COLUMNS, inplace=True)
+
+    # Create new column with date of data and re-order columns
+    df["data_date"] = to_date(data_date)
+    columns = df.columns.tolist()
+    columns = columns[:2] + columns[-1:] + columns[2:len(columns) - 1]
+    df = df[columns]
+
+    # Change percentage data into decimal integer form
+    df['price_change_pct'] = df.price_change_pct.apply(lambda x: float(x) / 100)
+    df['market_weight_pct'] = df.market_weight_pct.apply(lambda x: float(x) / 100)
+    df['foreign_shareholding_pct'] = df.foreign_shareholding_pct.apply(lambda x: float(x) / 100)
+
+    return df
+
+
+def _krx_numeric(values):    # float64 array from cells that are numbers or text with thousands separators
+    values = np.asarray(values, dtype=object)
+    try:
+        return values.astype('float64')
+    except (TypeError, ValueError):
+        text = np.char.strip(np.char.replace(values.astype(str), ',', ''))
+        text[(text == '') | (text == '-')] = 'nan'
+        return text.astype('float64')
+
+
+def _krx_frame(columns, data_date):    # Same layout as krx_marketdata_parse_excel from {English column name: array}
+    data_date = to_date(data_date)
+    frame = {}
+    for i, (name, values) in enumerate(columns.items()):
+        if i == 2:
+            frame['data_date'] = [data_date] * len(values)
+        if name in KRX_PCT_COLUMNS:
+            values = values / 100    # Change percentage data into decimal form
+        elif name not in KRX_TEXT_COLUMNS and not np.isnan(values).any():
+            values = values.astype('int64')
+        frame[name] = values
+    return pd.DataFrame(frame)
+
+
+def _krx_empty_frame(data_date):
+    return _krx_frame({name: np.array([], dtype=object if name in KRX_TEXT_COLUMNS else 'float64') for name in KRX_COLUMNS.values()}, data_date)
+
+
+def krx_marketdata_parse_xls(content, data_date=None):    # Reads the xls cells with xlrd directly, one typed array per column
+    try:
+        sheet = xlrd.open_workbook(file_contents=content, on_demand=True).sheet_by_index(0)
+    except xlrd.XLRDError:
+        return krx_marketdata_parse_excel(content, data_date)
+    if sheet.nrows == 0:
+        return _krx_empty_frame(data_date)
+    columns = {}
+    for i, header in enumerate(sheet.row_values(0)):
+        name = KRX_COLUMNS.get(header, header)
+        values = sheet.col_values(i, start_rowx=1)
+        if name == 'ticker':
+            columns[name] = np.array(['{:06d}'.format(int(v)) if isinstance(v, float) else v for v in values], dtype=object)
+        elif name in KRX_TEXT_COLUMNS:
+            columns[name] = np.array(values, dtype=object)
+        else:
+            columns[name] = _krx_numeric(values)
+    return _krx_frame(columns, data_date)
+
+
+def krx_marketdata_parse_csv(content, data_date=None):    # KRX csv download (cp949) through the C csv parser with fixed dtypes
+    if len(content.strip()) == 0:
+        return _krx_empty_frame(data_date)
+    df = pd.read_csv(BytesIO(content), encoding='cp949', thousands=',', na_values=['-'], dtype={'종목코드': str, '종목명': str})
+    columns = {}
+    for header in df.columns:
+        name = KRX_COLUMNS.get(header, header)
+        if name in KRX_TEXT_COLUMNS:
+            columns[name] = df[header].to_numpy(dtype=object)
+        else:
+            columns[name] = df[header].to_numpy(dtype='float64', na_value=np.nan)
+    return _krx_frame(columns, data_date)
+
+
+def krx_marketdata_parse(content, data_date=None, filetype='xls'):    # DataFrame with English column names from raw KRX file bytes
+    if filetype == 'csv':
+        return krx_marketdata_parse_csv(content, data_date)
+    return krx_marketdata_parse_xls(content, data_date)
+
+
+def krx_marketdata_download(data_date=None, session=None, cache=None, filetype='xls'):  # Download market data for all KRX listed stocks
+    # If parameter is left empty, assume today's date
+    if data_date is None:
+        date_str = datetime.today().strftime('%Y%m%d')
+    else:
+        date_str = data_date.strftime('%Y%m%d')
+
+    content = krx_marketdata_fetch(date_str, session=session, cache=cache, filetype=filetype)
+    return krx_marketdata_parse(content, data_date, filetype)
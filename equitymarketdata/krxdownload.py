@@ -0,0 +1,164 @@
+import argparse
+import calendar
+import sys
+from datetime import date, datetime, timedelta, timezone
+
+from equitymarketdata.config import config_list, config_path, load_config
+from equitymarketdata.db import create_sqlengine, execute_sql_file
+
+
+# Status messages of the streaming download (fetch -> parse -> validate -> write)
+STATUS_MESSAGES = {
+    'closed': "No Trading Day (Skipped)",
+    'empty': "No Trading Day",
+    'foreign_missing': "Foreign Ownership Information Not Yet Updated",
+    'exists': "Exists in Database",
+    'mismatch': "Exists in Database",
+    'written': "Downloaded"
+}
+
+
+def date_input(prompt_year, prompt_month, prompt_day, prompt_error):
+    while True:
+        ui_year = input(prompt_year)
+        ui_month = input(prompt_month)
+        ui_day = input(prompt_day)
+        try:
+            ui_date = date(int(ui_year), int(ui_month), int(ui_day))
+        except ValueError:
+            print(prompt_error)
+            continue
+        break
+    return (ui_date)
+
+
+def prompt_start_date(latest_sql_date):    # USER INPUT 1: Designate the dates to download market data
+    start_date = 0
+    if latest_sql_date is None:    # Empty database: there is no week before the latest date
+        start_date_input = 'no'
+    else:
+        start_date_input = input("Download KRX market data from a week before the latest date in SQL database?\nInput 'Yes' (or 'Y') or 'No' (or 'N'): ").lower()
+    while start_date == 0:
+        if start_date_input == "yes" or start_date_input == 'y':
+            start_date = latest_sql_date - timedelta(7)
+        elif start_date_input == 'no' or start_date_input == 'n':
+            start_date = date_input(prompt_year="Input YEAR for data download start date: ", prompt_month="Input MONTH for data download start date: ", prompt_day="Input DAY for data download start date: ", prompt_error="Incorrect date. Please input the date again.\n")
+        else:
+            start_date_input = input("Please input again.\nDownload KRX market data from a week before the latest date in SQL database?\nInput 'Yes' (or 'Y') or 'No' (or 'N'): ")
+    return start_date
+
+
+def prompt_end_date(today):
+    end_date = 0
+    end_date_input = input("Download KRX market data up to today?\nInput 'Yes' (or 'Y') or 'No' (or 'N'): ").lower()
+    while end_date == 0:
+        if end_date_input == "yes" or end_date_input == 'y':
+            end_date = today
+        elif end_date_input == "no" or end_date_input == 'n':
+            end_date = date_input(prompt_year="Input YEAR for data download end date: ", prompt_month="Input MONTH for data download end date: ", prompt_day="Input DAY for data download end date: ", prompt_error="Incorrect date. Please input the date again.\n")
+        else:
+            end_date_input = input("Please input again.\nDownload KRX market data up to today?\nInput 'Yes' (or 'Y') or 'No' (or 'N'): ")
+    return end_date
+
+
+def main(argv=None):
+    # Interactive KRX market data download (krx_historicaltradingdata_general_download_v1.0.py); settings come from the
+    # config file and environment (see equitymarketdata.config). --start/--end skip the date prompts
+    # Exit status 1 when some date needs attention (foreign ownership missing, row count mismatch)
+    import pandas as pd
+    from equitymarketdata.analytics import krx_derived_update
+    from equitymarketdata.cache import ResponseCache
+    from equitymarketdata.pipeline import krx_pipeline
+    from equitymarketdata.sync import krx_sync_bootstrap, krx_sync_counts, krx_sync_create, krx_sync_watermark
+    from equitymarketdata.timing import RunMetrics
+    from equitymarketdata.tradingcalendar import krx_trading_calendar
+
+    parser = argparse.ArgumentParser(description="Download KRX market data for a range of dates into SQL")
+    parser.add_argument("--config", default=None, help="ini file (default: $EQUITYMARKETDATA_CONFIG or ./equitymarketdata.ini)")
+    parser.add_argument("--start", type=date.fromisoformat, default=None, help="first date; asked for when not given")
+    parser.add_argument("--end", type=date.fromisoformat, default=None, help="last date; asked for when not given")
+    args = parser.parse_args(argv)
+    config = load_config(args.config)
+    paths, settings = config['paths'], config['krx']
+
+    # Create tables from the configured .sql files and the pooled engine to pull and insert dataframes
+    sqlengine = create_sqlengine(config=config)
+    for filename in config_list(paths['krx_init_sql']):
+        execute_sql_file(sqlengine, filename)
+
+    # Number of tickers for each date comes from the small krxmarketdata_sync table instead of a GROUP BY over krxmarketdata
+    # (filled from krxmarketdata once, on the first run). For unattended runs use: python -m equitymarketdata sync
+    krx_sync_create(sqlengine)
+    krx_sync_bootstrap(sqlengine)
+
+    # Date information
+    today = datetime.utcnow().replace(tzinfo=timezone.utc).astimezone(tz=None).date()
+    latest_sql_date = krx_sync_watermark(sqlengine)
+    print("Today is " + calendar.day_name[today.weekday()] + " " + str(today))
+    if latest_sql_date is not None:
+        print("Latest date in SQL database is " + calendar.day_name[latest_sql_date.weekday()] + " " + str(latest_sql_date))
+
+    start_date = args.start or prompt_start_date(latest_sql_date)
+    print("Selected start date is " + calendar.day_name[start_date.weekday()] + " " + str(start_date) + "\n")
+    end_date = args.end or prompt_end_date(today)
+    print("Selected end date is " + calendar.day_name[end_date.weekday()] + " " + str(end_date) + "\n")
+
+    dates = pd.date_range(start=start_date, end=end_date, freq='D')
+
+    # Days the trading calendar knows are closed are skipped without a request
+    store_path = config_path(paths['store'])
+    derived_path = config_path(paths['derived'])
+    cache_path = config_path(paths['cache'])
+    calendar_path = paths['calendar']
+    trading_calendar = krx_trading_calendar(calendar_path, sqlengine)
+
+    # Statistics variables for download progress and sanity check
+    download_count = 0
+    download_total = len(dates)
+    sanity_check = []
+    foreign_ownership_data_null = []
+    existing_counts = krx_sync_counts(sqlengine, start_date, end_date)
+
+    with RunMetrics('krx_download', config_path(paths['events']), config_path(paths['metrics'])) as run_metrics:
+        # For Loop to go through the dates (results arrive in date order)
+        for record in krx_pipeline(dates, sqlengine, existing_counts, fetch_workers=settings.getint('workers'), rate_limit=settings.getfloat('rate_limit'),
+                                   cache=ResponseCache(cache_path) if cache_path else None, filetype=settings['filetype'],
+                                   write_method=settings['write_method'], store_path=store_path, calendar=trading_calendar,
+                                   timer=run_metrics, parse_workers=settings.getint('parse_workers')):
+            data_date = record['data_date']    # Already recorded in krxmarketdata_sync by krx_pipeline
+            download_count += 1
+            download_percentage = (download_count / download_total) * 100
+            print_info = {
+                'date': data_date.strftime('%Y-%m-%d'),
+                'day': calendar.day_name[data_date.weekday()],
+                'numtickers': record['numtickers'],
+                'downloadpct': download_percentage
+            }
+            if record['status'] == 'foreign_missing':
+                foreign_ownership_data_null.append(data_date)
+            elif record['status'] == 'mismatch':
+                sanity_check.append(data_date)
+            print(("{date}{day:>10}:{numtickers:6d}{downloadpct:10.3f}% " + STATUS_MESSAGES[record['status']]).format(**print_info))
+
+        trading_calendar.save(calendar_path)
+        if store_path is not None and derived_path is not None:    # Only the dates new to the store are computed
+            print("Derived figures updated for " + str(len(krx_derived_update(store_path, derived_path))) + " dates")
+
+        print("\nDownload Complete")
+        run_metrics.report()    # Time per stage (OTP call, download, parse, write, ...) and counters (retries, empty days, ...)
+    if len(sanity_check) == 0:
+        print("Sanity Check Cleared")
+    else:
+        print("Check data for following dates")
+        print(sanity_check)
+        print("To compare them with KRX and repair: python -m equitymarketdata reconcile --start {} --end {} --repair".format(min(sanity_check).strftime('%Y-%m-%d'), max(sanity_check).strftime('%Y-%m-%d')))
+    if len(foreign_ownership_data_null) == 0:
+        print("All Downloaded Data includes Foreign Ownership Information")
+    else:
+        print("Foreign Ownership data missing for following dates. Did not download market trading data in SQL")
+        print(foreign_ownership_data_null)
+    return 1 if sanity_check or foreign_ownership_data_null else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
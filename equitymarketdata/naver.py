@@ -0,0 +1,215 @@
+import re
+from datetime import date
+from functools import lru_cache
+
+import lxml.html
+import numpy as np
+import pandas as pd
+import requests
+
+
+NAVER_CONSENSUS_URL = "http://companyinfo.stock.naver.com/v1/company/ajax/cF1001.aspx"    # URL for financial estimate consensus in Naver Finance
+NAVER_CACHE_TTL = 12 * 60 * 60    # Seconds a consensus page is reused; estimates change at most daily
+
+# Financial items with designated codes
+FINANCIAL_ITEM_KEYS = {
+    "매출액": 1100,
+    "영업이익": 1300,
+    "영업이익(발표기준)": 1301,
+    "세전계속사업이익": 1500,
+    "당기순이익": 1600,
+    "당기순이익(지배)": 1601,
+    "당기순이익(비지배)": 1602,
+    "자산총계": 2100,
+    "부채총계": 2200,
+    "자본총계": 2300,
+    "자본총계(지배)": 2301,
+    "자본총계(비지배)": 2302,
+    "자본금": 2303,
+    "영업활동현금흐름": 3100,
+    "투자활동현금흐름": 3200,
+    "재무활동현금흐름": 3300,
+    "CAPEX": 3201,
+    "FCF": 3401,
+    "이자발생부채": 2201,
+    "영업이익률": 4130,
+    "순이익률": 4160,
+    "ROE(%)": 4163,
+    "ROA(%)": 4164,
+    "부채비율": 4220,
+    "자본유보율": 4230,
+    "EPS(원)": 4165,
+    "PER(배)": 4501,
+    "BPS(원)": 4301,
+    "PBR(배)": 4502,
+    "현금DPS(원)": 4331,
+    "현금배당수익률": 4332,
+    "현금배당성향(%)": 4333,
+    "발행주식수(보통주)": 5000,
+    "유보율": 4230,    # Term used in K-GAAP
+    "현금배당성향": 4333    # Term used in K-GAAP
+}
+
+# SQL table per consensus period; annual and quarterly figures share statement periods (e.g. December), so they are kept apart
+NAVER_CONSENSUS_TABLES = {
+    "Y": "naverfinance_consensus_financials",
+    "Q": "naverfinance_consensus_financials_quarterly"
+}
+
+# Columns identifying one consensus figure; the latest update_date per key is the current state
+CONSENSUS_KEY_COLUMNS = ["ticker", "statement_period", "financial_item_code", "accounting_standard", "forecast_indication"]
+
+# Accounting standards with designated codes
+ACCOUNTING_STANDARD_KEYS = {
+    "IFRS연결": 1,
+    "IFRS별도": 2,
+    "GAAP연결": 3,
+    "GAAP개별": 4
+}
+
+
+def naverfinance_consensus_fetch(ticker, period, stmnt_type, session=None, cache=None):    # Raw html of the consensus page for one ticker
+    http = session if session is not None else requests    # Reuse keep-alive connections when a session is given
+    code = {    # Code to request specifics on the consensus
+        "cmp_cd": ticker,
+        "fin_typ": stmnt_type,
+        "freq_typ": period
+    }
+
+    # Serve fresh pages from the cache; revalidate expired ones with the validators the server sent
+    headers = {}
+    if cache is not None:
+        cache_key = cache.key(NAVER_CONSENSUS_URL, code)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            if cached[1]['fresh']:
+                return cached[0]
+            if cached[1]['etag']:
+                headers['If-None-Match'] = cached[1]['etag']
+            if cached[1]['last_modified']:
+                headers['If-Modified-Since'] = cached[1]['last_modified']
+
+    page = http.get(NAVER_CONSENSUS_URL, params=code, headers=headers)    # Sending in request for page (URL and code)
+    if page.status_code == 304:    # Unchanged since it was cached
+        cache.refresh(cache_key, NAVER_CACHE_TTL)
+        return cached[0]
+    page.raise_for_status()
+    if cache is not None:
+        cache.put(cache_key, page.content, ttl=NAVER_CACHE_TTL, etag=page.headers.get('ETag'), last_modified=page.headers.get('Last-Modified'))
+    return page.content    # Separating the content of the requested page
+
+
+# Column header patterns of the cF1001 table, e.g. "2020/12(E)" + "(IFRS연결)"
+NAVER_PERIOD_PATTERN = re.compile(r'(\d{4})/(\d{2})')
+NAVER_STANDARD_PATTERN = re.compile(r'\((\D{6})\)')
+NAVER_FORECAST_PATTERN = re.compile(r'\(E\)')
+NAVER_HTML_PARSER = lxml.html.HTMLParser(encoding='utf-8')    # The ajax fragment declares no charset, lxml would read the bytes as latin-1
+
+
+@lru_cache(maxsize=None)
+def naver_period_date(year, month):    # Statement period end date of "YYYY/MM": month end for quarter ends, else the 1st
+    day = {3: 31, 6: 30, 9: 30, 12: 31}.get(month, 1)
+    return date(year, month, day)
+
+
+def _naver_cell_text(cell):
+    return " ".join(cell.text_content().split())
+
+
+def _naver_cell_value(text):    # "1,234.5" -> 1234.5; blanks, "-" and "N/A" -> NaN
+    try:
+        return float(text.replace(',', ''))
+    except ValueError:
+        return np.nan
+
+
+def naverfinance_consensus_parse(content, ticker, update_date):
+    # Long-format consensus DataFrame from the raw page html, read in one pass with lxml
+    # Rows are every dated column, item by item, with accounting_standard mapped to its code
+    # Checked against a cF1001 page in benchmarks/bench_naver_parse.py (check_fixture)
+    table = next(lxml.html.fromstring(content, parser=NAVER_HTML_PARSER).iter('table'), None)
+    if table is None:
+        raise ValueError("No tables found")
+    header_rows = table.findall('thead/tr')
+    body_rows = table.findall('tbody/tr') or [row for row in table.iter('tr') if row.getparent().tag != 'thead']
+    body_rows = [row for row in body_rows if len(row) > 1]
+
+    # Column headers: the last header row labels the data cells (the item name column spans both header rows)
+    width = max(len(row) for row in body_rows) - 1 if body_rows else 0
+    labels = [_naver_cell_text(cell) for cell in header_rows[-1]] if header_rows else []
+    if len(labels) > width:
+        labels = labels[len(labels) - width:]
+    periods, standards, forecasts, keep = [], [], [], []
+    for j, label in enumerate(labels):
+        period = NAVER_PERIOD_PATTERN.search(label)
+        if period is None:
+            continue    # Columns without a period are not figures
+        standard = NAVER_STANDARD_PATTERN.search(label)
+        keep.append(j)
+        periods.append(naver_period_date(int(period.group(1)), int(period.group(2))))
+        standards.append(None if standard is None else standard.group(1))
+        forecasts.append('E' if NAVER_FORECAST_PATTERN.search(label) else 'A')
+
+    # Figures as one items x columns array
+    items = []
+    values = np.full((len(body_rows), len(keep)), np.nan)
+    for i, row in enumerate(body_rows):
+        cells = list(row)
+        items.append(_naver_cell_text(cells[0]))
+        for k, j in enumerate(keep):
+            if j + 1 < len(cells):
+                values[i, k] = _naver_cell_value(cells[j + 1].text_content().strip())
+
+    n_items = len(items)
+    financial_item = pd.Series(np.tile(np.asarray(items, dtype=object), len(keep)))
+    financial_item_code = financial_item.map(FINANCIAL_ITEM_KEYS)
+    value = values.T.reshape(-1)    # Column-major, like DataFrame.unstack
+    value = np.where(financial_item_code.to_numpy(dtype='float64', na_value=np.nan) < 4000, value * (10**8), value)    # Value units into ones
+    df_consensus = pd.DataFrame({
+        'ticker': ticker,
+        'statement_period': np.repeat(np.asarray(periods, dtype=object), n_items),
+        'accounting_standard': pd.Series([ACCOUNTING_STANDARD_KEYS.get(standard, standard) for standard in standards]).repeat(n_items).to_numpy(),
+        'financial_item_code': financial_item_code,
+        'forecast_indication': np.repeat(np.asarray(forecasts, dtype=object), n_items),
+        'financial_item': financial_item,
+        'value': value
+    })
+    df_consensus["update_date"] = update_date
+    return df_consensus
+
+
+def naverfinance_consensus_create_tables(sqlengine, periods):    # Create the tables of other periods with the layout of the annual one
+    connection = sqlengine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for period in periods:
+            table = NAVER_CONSENSUS_TABLES[period]
+            if table == NAVER_CONSENSUS_TABLES["Y"]:
+                continue
+            if sqlengine.dialect.name == 'mysql':
+                cursor.execute("CREATE TABLE IF NOT EXISTS {} LIKE {}".format(table, NAVER_CONSENSUS_TABLES["Y"]))
+            else:
+                cursor.execute("CREATE TABLE IF NOT EXISTS {} AS SELECT * FROM {} WHERE 0".format(table, NAVER_CONSENSUS_TABLES["Y"]))
+        cursor.close()
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def naverfinance_consensus_latest(sqlengine, table=NAVER_CONSENSUS_TABLES["Y"]):    # Last updated financials of every ticker from SQL in a single windowed query
+    # Needs window functions (MySQL 8.0+, SQLite 3.25+); reads each row once instead of one full-history scan per ticker
+    sql = """
+    SELECT
+        *
+    FROM (
+        SELECT
+            t.*,
+            ROW_NUMBER() OVER (
+                PARTITION BY ticker, statement_period, financial_item_code, accounting_standard, forecast_indication
+                ORDER BY update_date DESC
+            ) AS latest_rank
+        FROM {t} t
+    ) ranked
+    WHERE latest_rank = 1;""".format(t=table)
+    df_consensus_latest = pd.read_sql(sql, con=sqlengine)
+    return df_consensus_latest.drop(columns='latest_rank')
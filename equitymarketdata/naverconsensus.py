@@ -0,0 +1,105 @@
+import argparse
+import calendar
+import sys
+from datetime import datetime, timedelta, timezone
+
+from equitymarketdata.config import config_list, config_path, load_config
+from equitymarketdata.db import create_sqlengine, execute_sql_file
+
+
+def prompt_record_date(today):    # 'update_date' of the scraped rows: today or yesterday
+    yesterday = today - timedelta(1)
+    date_input = input("Today or Yesterday?    ").lower()
+    sql_record_date = 0
+    while (sql_record_date != today) or (sql_record_date != yesterday):
+        if date_input == "today":
+            sql_record_date = today
+            break
+        elif date_input == "yesterday":
+            sql_record_date = yesterday
+            break
+        else:
+            date_input = input("Input again. Today or Yesterday")
+    return sql_record_date
+
+
+def main(argv=None):
+    # Interactive Naver Finance consensus scrape of every KRX-listed ticker (naverfinance_financialsconsensus_scraping_v1.0.py)
+    # Settings come from the config file and environment (see equitymarketdata.config); --update-date skips the prompt
+    # Exit status 1 when some pages failed
+    from equitymarketdata.cache import ResponseCache
+    from equitymarketdata.krx import krx_marketdata_download
+    from equitymarketdata.scraper import naverfinance_consensus_batch
+    from equitymarketdata.timing import RunMetrics
+    from equitymarketdata.tradingcalendar import krx_trading_calendar
+
+    parser = argparse.ArgumentParser(description="Scrape Naver Finance consensus figures of every KRX-listed ticker into SQL")
+    parser.add_argument("--config", default=None, help="ini file (default: $EQUITYMARKETDATA_CONFIG or ./equitymarketdata.ini)")
+    parser.add_argument("--update-date", choices=["today", "yesterday"], default=None, help="'update_date' to record; asked for when not given")
+    args = parser.parse_args(argv)
+    config = load_config(args.config)
+    paths, settings = config['paths'], config['naver']
+
+    # SET UP REQUIRED SQL DATABASES: financial_item_keys, accounting_standard_keys, naverfinance_consensus_financials
+    sqlengine = create_sqlengine(config=config)
+    for filename in config_list(paths['naver_init_sql']):
+        execute_sql_file(sqlengine, filename)
+    print("")  # To leave an empty line after messages
+
+    ############### MAIN LOOP TO EXECUTE SCRAPING ###############
+    # Raw KRX files and Naver pages are cached on disk, so repeated downloads of the same date or page are not sent again
+    cache_path = config_path(paths['cache'])
+    response_cache = ResponseCache(cache_path) if cache_path else None
+    calendar_path = paths['calendar']
+    trading_calendar = krx_trading_calendar(calendar_path, sqlengine)
+
+    # Date Inputs and Defining Date Information
+    today = datetime.utcnow().replace(tzinfo=timezone.utc).astimezone(tz=None).date()
+    yesterday = today - timedelta(1)
+    latest_trading_day = trading_calendar.latest_trading_day(today)
+    df_krx_excel = krx_marketdata_download(latest_trading_day, cache=response_cache)    # DataFrame of KRX market data in Excel
+    while len(df_krx_excel) == 0:    # Today's file is not published yet, or a holiday the calendar did not know about
+        if latest_trading_day < today:
+            trading_calendar.mark(latest_trading_day, False)
+        latest_trading_day = trading_calendar.previous_trading_day(latest_trading_day)
+        df_krx_excel = krx_marketdata_download(latest_trading_day, cache=response_cache)
+    trading_calendar.mark(latest_trading_day, True)
+    trading_calendar.save(calendar_path)
+
+    print("Today is " + calendar.day_name[today.weekday()] + " " + str(today))
+    print("Yesterday was " + calendar.day_name[yesterday.weekday()] + " " + str(yesterday))
+    print("Latest trading day was " + calendar.day_name[latest_trading_day.weekday()] + " " + str(latest_trading_day))
+
+    if args.update_date is not None:
+        sql_record_date = today if args.update_date == "today" else yesterday
+    else:
+        sql_record_date = prompt_record_date(today)
+    print("'update_date' on SQL will be recorded as " + str(sql_record_date))
+
+    # Every period x statement type combination is scraped in one run
+    consensus_periods = config_list(settings['periods'])
+    statement_types = [int(t) for t in config_list(settings['statement_types'])]
+    ticker_list = df_krx_excel.iloc[:, 0]    # List of tickers
+
+    # The checkpoint lets a crashed run resume at the page where it stopped
+    checkpoint_path = "naverfinance_consensus_{}_{}_{}.checkpoint".format(sql_record_date.strftime('%Y%m%d'), "".join(consensus_periods), "".join(str(t) for t in statement_types))
+
+    with RunMetrics('naver_consensus', config_path(paths['events']), config_path(paths['metrics'])) as run_metrics:
+        # Scraping exercise and result printing
+        consensus_na = naverfinance_consensus_batch(ticker_list, consensus_periods, statement_types, sql_record_date, sqlengine,
+                                                    max_workers=settings.getint('workers'), rate_limit=settings.getfloat('rate_limit'),
+                                                    checkpoint_path=checkpoint_path, cache=response_cache,
+                                                    parse_workers=settings.getint('parse_workers'), timer=run_metrics,
+                                                    revisions_path=config_path(paths['revisions']))
+        run_metrics.report()    # Time per stage (fetch, parse, diff, write) and counters (retries, rows skipped as unchanged, ...)
+
+    if len(consensus_na) == 0:
+        print("All Tickers Scraped")
+    else:
+        print(len(consensus_na))
+        print(consensus_na)
+    return 1 if consensus_na else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import pyarrow as pa
+
+
+def _parse_to_arrow(parse, content, args):    # Runs in a worker process: parse and serialize the result as an Arrow IPC stream
+    table = pa.Table.from_pandas(parse(content, *args), preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def arrow_to_frame(buffer):    # DataFrame from an Arrow IPC stream produced by _parse_to_arrow
+    return pa.ipc.open_stream(buffer).read_all().to_pandas()
+
+
+class ParsePool:
+    # Process pool for the CPU-bound parsing of raw responses, so parsing scales past one core despite the GIL
+    # Raw bytes go to a worker; the parsed frame comes back as one Arrow IPC buffer, which is much cheaper to pickle
+    # and rebuild than a DataFrame of Python objects. parse must be a module-level function (it is pickled by name)
+    # parse() blocks the calling thread only, so several fetch or pipeline threads can keep all workers busy
+    def __init__(self, workers=4):
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+
+    def submit(self, parse, content, *args):    # Future of the Arrow buffer
+        return self.executor.submit(_parse_to_arrow, parse, content, args)
+
+    def parse(self, parse, content, *args):    # Same result as parse(content, *args), computed in a worker process
+        return arrow_to_frame(self.submit(parse, content, *args).result())
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
@@ -0,0 +1,264 @@
+import argparse
+import queue
+import sys
+import threading
+from datetime import date
+from functools import partial
+
+import pandas as pd
+
+from equitymarketdata.backfill import krx_is_known_closed
+from equitymarketdata.dates import to_date
+from equitymarketdata.db import create_sqlengine
+from equitymarketdata.httpclient import create_session, retry_call
+from equitymarketdata.krx import krx_marketdata_fetch, krx_marketdata_parse
+from equitymarketdata.parsepool import ParsePool
+from equitymarketdata.sink import bulk_write
+from equitymarketdata.timing import NULL_TIMER, RunMetrics
+
+
+_END = object()    # Marks the end of a stage's input
+
+
+def _put(q, entry, stop):    # Blocking put that gives up once the pipeline is stopping
+    while not stop.is_set():
+        try:
+            q.put(entry, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def run_pipeline(items, stages, max_in_flight=16, timer=None):
+    # Run items through stages [(name, func, workers), ...], each stage on its own threads, connected by bounded queues
+    # At most max_in_flight items are between the input and the consumer at any time, so memory stays flat and a slow
+    # stage (e.g. the database write) holds back the stages before it instead of letting work pile up
+    # Yields the output of the last stage in input order; the first exception raised by a stage is re-raised here
+    queues = [queue.Queue(max_in_flight + 1) for _ in range(len(stages) + 1)]    # + 1 leaves room for _END
+    in_flight = threading.Semaphore(max_in_flight)
+    stop = threading.Event()
+    failed = []
+
+    def feeder():
+        try:
+            for seq, item in enumerate(items):
+                while not in_flight.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                _put(queues[0], (seq, item), stop)
+        except Exception as e:
+            failed.append(e)
+            stop.set()
+        finally:
+            queues[0].put(_END)
+
+    def worker(i, name, func, remaining):
+        while True:
+            entry = queues[i].get()
+            if entry is _END:
+                queues[i].put(_END)    # Let the other workers of this stage see it too
+                with remaining[1]:
+                    remaining[0] -= 1
+                    if remaining[0] == 0:    # Last worker of the stage closes the next stage's input
+                        queues[i + 1].put(_END)
+                return
+            if stop.is_set():
+                continue    # Drain without working
+            seq, item = entry
+            try:
+                if timer is not None:
+                    with timer.time(name):
+                        item = func(item)
+                else:
+                    item = func(item)
+            except Exception as e:
+                failed.append(e)
+                stop.set()
+                continue
+            _put(queues[i + 1], (seq, item), stop)
+
+    threads = [threading.Thread(target=feeder, daemon=True)]
+    for i, (name, func, workers) in enumerate(stages):
+        remaining = [workers, threading.Lock()]
+        threads += [threading.Thread(target=worker, args=(i, name, func, remaining), daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    buffer = {}    # Finished items waiting for an earlier one; never more than max_in_flight
+    next_seq = 0
+    try:
+        while True:
+            if failed:
+                raise failed[0]
+            try:
+                entry = queues[-1].get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if entry is _END:
+                break
+            seq, item = entry
+            buffer[seq] = item
+            while next_seq in buffer:
+                item = buffer.pop(next_seq)
+                next_seq += 1
+                in_flight.release()
+                yield item
+        if failed:
+            raise failed[0]
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def krx_pipeline(dates, sqlengine, existing_counts=None, fetch_workers=4, rate_limit=None, retries=3, backoff=1.0,
+                 holidays=None, cache=None, filetype='xls', write_method='executemany', store_path=None,
+                 max_in_flight=16, session=None, timer=None, calendar=None, parse_workers=0, sync=True):
+    # Streaming KRX backfill: fetch -> parse -> validate -> write, overlapping network, parsing and database writes
+    # existing_counts maps data_date -> rows already stored; those dates are checked instead of written
+    # Yields one record per date in date order: {'data_date', 'status', 'numtickers'} where status is one of
+    # 'closed' (skipped without a request), 'empty' (no trading day), 'foreign_missing', 'exists', 'mismatch', 'written'
+    # calendar (a TradingCalendar) decides which dates are requested and records every day seen; without it only
+    # weekends and fixed-date holidays are skipped
+    # parse_workers > 0 parses on that many processes (ParsePool) instead of one thread
+    # timer (a StageTimer or RunMetrics) times every stage plus the OTP and download calls, counts dates per status
+    # ('days_<status>'), retries and rows written, and gets a 'krx_date' event per date
+    # sync records every date's outcome in krxmarketdata_sync right after its write, so later syncs and downloads know
+    # what is stored whichever job wrote it (see equitymarketdata.sync)
+    existing_counts = {} if existing_counts is None else existing_counts
+    if sync:
+        from equitymarketdata.sync import krx_sync_bootstrap, krx_sync_create, krx_sync_record    # sync imports this module
+        krx_sync_create(sqlengine)
+        krx_sync_bootstrap(sqlengine)
+    if session is None:
+        session = create_session(pool_size=fetch_workers, rate_limit=rate_limit)
+    fetch = partial(krx_marketdata_fetch, session=session, cache=cache, filetype=filetype, timer=timer)
+
+    today = date.today()
+
+    def is_closed(data_date):
+        if calendar is not None:
+            return not calendar.is_trading_day(data_date)
+        return krx_is_known_closed(data_date, holidays)
+
+    def fetch_stage(record):
+        if is_closed(record['data_date']):
+            record['status'] = 'closed'
+        else:
+            record['content'] = retry_call(fetch, record['data_date'].strftime('%Y%m%d'), retries=retries, backoff=backoff, timer=timer)
+        return record
+
+    pool = ParsePool(parse_workers) if parse_workers > 0 else None
+
+    def parse_stage(record):
+        if 'content' in record:
+            if pool is not None:
+                record['df'] = pool.parse(krx_marketdata_parse, record.pop('content'), record['data_date'], filetype)
+            else:
+                record['df'] = krx_marketdata_parse(record.pop('content'), record['data_date'], filetype)
+            record['numtickers'] = len(record['df'])
+        return record
+
+    def validate_stage(record):
+        if 'df' not in record:
+            return record
+        df_data = record['df']
+        stored = existing_counts.get(to_date(record['data_date']))
+        if len(df_data) > 0 and len(df_data.dropna(subset=['foreign_shareholding', 'foreign_shareholding_pct'])) == 0:
+            record['status'] = 'foreign_missing'
+        elif stored is not None:
+            record['status'] = 'exists' if stored == len(df_data) else 'mismatch'
+        elif len(df_data) == 0:
+            record['status'] = 'empty'
+        else:
+            record['status'] = 'new'
+        if calendar is not None and (len(df_data) > 0 or to_date(record['data_date']) < today):
+            calendar.mark(record['data_date'], len(df_data) > 0)    # Today's file may simply not be published yet
+        if record['status'] != 'new':
+            del record['df']    # Nothing left to do with the data
+        return record
+
+    def write_stage(record):
+        if record.get('status') == 'new':
+            df_data = record.pop('df')
+            bulk_write(df_data, 'krxmarketdata', sqlengine, method=write_method)
+            if store_path is not None:
+                from equitymarketdata.store import krx_store_write
+                krx_store_write(df_data, store_path)
+            record['status'] = 'written'
+        if sync:
+            with (timer or NULL_TIMER).time('sync_record'):
+                krx_sync_record(sqlengine, record, existing_counts)
+        return record
+
+    stages = [
+        ('fetch', fetch_stage, fetch_workers),
+        ('parse', parse_stage, max(parse_workers, 1)),
+        ('validate', validate_stage, 1),
+        ('write', write_stage, 1)
+    ]
+    records = ({'data_date': data_date, 'status': None, 'numtickers': 0} for data_date in dates)
+    try:
+        for record in run_pipeline(records, stages, max_in_flight=max_in_flight, timer=timer):
+            if timer is not None:
+                timer.count('days_' + record['status'])
+                if record['status'] == 'written':
+                    timer.count('rows_written', record['numtickers'])
+                timer.event('krx_date', data_date=to_date(record['data_date']), status=record['status'], numtickers=record['numtickers'])
+            yield record
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def krx_existing_counts(sqlengine):    # data_date (datetime.date) -> number of rows stored in krxmarketdata
+    sql = """
+    SELECT
+        data_date, count(*) AS 'data_count'
+    FROM krxmarketdata
+    GROUP BY data_date
+    ;"""
+    df_sqldatacount = pd.read_sql(sql, con=sqlengine)
+    return dict(zip((to_date(pd.Timestamp(day)) for day in df_sqldatacount['data_date']), df_sqldatacount['data_count']))    # SQLite returns strings
+
+
+def main(argv=None):    # python -m equitymarketdata.pipeline --start 2020-01-01 --end 2020-12-31 --sql-url mysql+mysqldb://...
+    parser = argparse.ArgumentParser(description="Streaming KRX market data backfill")
+    parser.add_argument("--start", type=date.fromisoformat, required=True)
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--sql-url", default=None, help="SQLAlchemy URL; default from the config file or EQUITYMARKETDATA_SQL_* variables")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate-limit", type=float, default=4)
+    parser.add_argument("--cache", default=None, help="response cache directory")
+    parser.add_argument("--store", default=None, help="Parquet store directory written next to SQL")
+    parser.add_argument("--filetype", choices=['xls', 'csv'], default='xls')
+    parser.add_argument("--max-in-flight", type=int, default=16)
+    parser.add_argument("--parse-workers", type=int, default=0, help="parser processes; 0 parses in a thread")
+    parser.add_argument("--calendar", default=None, help="trading calendar file, seeded from krxmarketdata when missing")
+    parser.add_argument("--events", default=None, help="append JSON-lines events of the run to this file")
+    parser.add_argument("--metrics", default=None, help="write Prometheus text metrics to this file when done")
+    args = parser.parse_args(argv)
+
+    cache = None
+    if args.cache is not None:
+        from equitymarketdata.cache import ResponseCache
+        cache = ResponseCache(args.cache)
+    sqlengine = create_sqlengine(args.sql_url)
+    calendar = None
+    if args.calendar is not None:
+        from equitymarketdata.tradingcalendar import krx_trading_calendar
+        calendar = krx_trading_calendar(args.calendar, sqlengine)
+    dates = pd.date_range(start=args.start, end=args.end, freq='D')
+    with RunMetrics('krx_pipeline', args.events, args.metrics) as metrics:
+        for record in krx_pipeline(dates, sqlengine, krx_existing_counts(sqlengine), fetch_workers=args.workers, rate_limit=args.rate_limit,
+                                   cache=cache, filetype=args.filetype, store_path=args.store, max_in_flight=args.max_in_flight,
+                                   calendar=calendar, parse_workers=args.parse_workers, timer=metrics):
+            print("{}:{:6d} {}".format(record['data_date'].strftime('%Y-%m-%d'), record['numtickers'], record['status']))
+        metrics.report()
+    if calendar is not None:
+        calendar.save(args.calendar)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from equitymarketdata.dates import to_date
+from equitymarketdata.naver import CONSENSUS_KEY_COLUMNS, NAVER_CONSENSUS_TABLES
+from equitymarketdata.store import KRX_STORE_SCHEMA, long_to_panels, store_read
+
+
+def _nbytes(value):    # Approximate memory held by a cached value
+    # deep: object and string columns (tickers, dates, item names) count their Python objects, not just the pointers
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum()) + int(value.columns.memory_usage(deep=True))
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return 0
+
+
+class SliceCache:
+    # In-memory LRU cache of query results; the least recently used entries are evicted above max_bytes
+    def __init__(self, max_bytes=512 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()    # key -> (value, nbytes), oldest first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        nbytes = _nbytes(value)
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return    # Larger than the whole cache; not worth evicting everything for
+            self.entries[key] = (value, nbytes)
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes:
+                self.total_bytes -= self.entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+class ConsensusAsOfIndex:
+    # Point-in-time index over the consensus history of one ticker
+    # Rows are sorted by (financial_item_code, update_date), so an as-of lookup is two binary searches plus a
+    # pass over the rows of that one item, instead of a scan of the whole history
+    def __init__(self, df_consensus):
+        df = df_consensus.copy()
+        df['update_date'] = pd.to_datetime(df['update_date'])
+        df['statement_period'] = pd.to_datetime(df['statement_period'])
+        df['financial_item_code'] = pd.to_numeric(df['financial_item_code'], errors='coerce')
+        self.df = df.sort_values(['financial_item_code', 'update_date'], kind='mergesort').reset_index(drop=True)
+        self.item_codes = self.df['financial_item_code'].to_numpy(dtype='float64', na_value=np.nan)
+        self.update_dates = self.df['update_date'].to_numpy(dtype='datetime64[ns]')
+        self.nbytes = _nbytes(self.df)
+
+    def __len__(self):
+        return len(self.df)
+
+    def as_of(self, item_code, as_of=None):
+        # Rows of item_code as known on as_of: for each statement period, accounting standard and forecast indication
+        # the latest row with update_date <= as_of (as_of=None: the latest overall)
+        lo = np.searchsorted(self.item_codes, item_code, side='left')
+        hi = np.searchsorted(self.item_codes, item_code, side='right')
+        if as_of is not None:
+            hi = lo + np.searchsorted(self.update_dates[lo:hi], np.datetime64(pd.Timestamp(as_of), 'ns'), side='right')
+        rows = self.df.iloc[lo:hi]
+        rows = rows.drop_duplicates(subset=CONSENSUS_KEY_COLUMNS, keep='last')    # Sorted by update_date, so last is latest
+        return rows.sort_values(['statement_period', 'accounting_standard', 'forecast_indication']).reset_index(drop=True)
+
+
+class MarketDataQuery:
+    # Read path over stored market data
+    # KRX panels come from the Parquet store when store_path is given, otherwise from krxmarketdata; filters on dates,
+    # tickers and columns are pushed down to the store or into the SQL WHERE clause
+    # Results are cached in memory (cache_bytes) and shared between calls, so treat returned frames as read-only
+    def __init__(self, sqlengine=None, store_path=None, cache_bytes=512 * 1024 ** 2):
+        if sqlengine is None and store_path is None:
+            raise ValueError("either sqlengine or store_path is needed")
+        self.sqlengine = sqlengine
+        self.store_path = store_path
+        self.cache = SliceCache(cache_bytes)
+
+    def _read_long(self, fields, tickers, start, end):    # Long rows (data_date, ticker, fields) from the store or SQL
+        if self.store_path is not None:
+            table = store_read(self.store_path, KRX_STORE_SCHEMA, start, end, tickers, columns=['data_date', 'ticker'] + fields)
+            return table.to_pandas()
+        conditions = []
+        if start is not None:
+            conditions.append("data_date >= '{}'".format(start.strftime('%Y-%m-%d')))
+        if end is not None:
+            conditions.append("data_date <= '{}'".format(end.strftime('%Y-%m-%d')))
+        if tickers is not None:
+            conditions.append("ticker IN ({})".format(", ".join("'{}'".format(ticker) for ticker in tickers)))
+        sql = """
+        SELECT
+            data_date, ticker, {columns}
+        FROM krxmarketdata
+        {where}
+        ;""".format(columns=", ".join(fields), where="WHERE " + " AND ".join(conditions) if conditions else "")
+        df = pd.read_sql(sql, con=self.sqlengine)
+        df['data_date'] = pd.to_datetime(df['data_date']).dt.date
+        return df
+
+    def get_panel(self, fields, tickers=None, start=None, end=None):
+        # Wide float64 panels (data_date x ticker) of KRX fields over [start, end]
+        # fields: one name (returns a DataFrame) or a list (returns {field: DataFrame}); tickers=None for all tickers
+        single = isinstance(fields, str)
+        fields = [fields] if single else list(fields)
+        start = None if start is None else to_date(pd.Timestamp(start))
+        end = None if end is None else to_date(pd.Timestamp(end))
+        ticker_key = None if tickers is None else tuple(sorted(set(tickers)))
+
+        panels = {}
+        missing = []
+        for field in fields:
+            panel = self.cache.get(('panel', field, ticker_key, start, end))
+            if panel is None and ticker_key is not None:    # A cached all-ticker slice of the same range also answers
+                superset = self.cache.get(('panel', field, None, start, end))
+                if superset is not None:
+                    panel = superset.reindex(columns=pd.Index(ticker_key, name='ticker')).dropna(axis=1, how='all')
+            if panel is None:
+                missing.append(field)
+            else:
+                panels[field] = panel
+        if missing:    # One read for all fields that were not cached
+            read = long_to_panels(self._read_long(missing, ticker_key, start, end), missing)
+            for field in missing:
+                self.cache.put(('panel', field, ticker_key, start, end), read[field])
+                panels[field] = read[field]
+        return panels[fields[0]] if single else {field: panels[field] for field in fields}
+
+    def consensus_index(self, ticker, period="Y"):    # ConsensusAsOfIndex of one ticker, loaded with one indexed query and cached
+        key = ('consensus', ticker, period)
+        index = self.cache.get(key)
+        if index is None:
+            if self.sqlengine is None:
+                raise ValueError("consensus queries need sqlengine")
+            sql = """
+            SELECT
+                *
+            FROM {t}
+            WHERE ticker = '{a}'
+            ;""".format(t=NAVER_CONSENSUS_TABLES[period], a=ticker)
+            index = ConsensusAsOfIndex(pd.read_sql(sql, con=self.sqlengine))
+            self.cache.put(key, index)
+        return index
+
+    def get_consensus(self, ticker, item_code, as_of=None, period="Y"):
+        # Consensus figures of one financial item as they were known on as_of (an update_date; None for the latest)
+        return self.consensus_index(ticker, period).as_of(item_code, as_of)
+
+    def invalidate(self):    # Drop cached results, e.g. after new data was written
+        self.cache.clear()
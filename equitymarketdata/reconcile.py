@@ -0,0 +1,148 @@
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from equitymarketdata.backfill import krx_backfill
+from equitymarketdata.dates import to_date
+from equitymarketdata.db import create_sqlengine
+from equitymarketdata.diff import row_hash
+from equitymarketdata.sink import replace_write
+from equitymarketdata.sync import krx_sync_create, krx_sync_record
+
+
+# Columns covered by the per-date checksum: the identity of each row and the figures downstream code relies on
+# Percentages are left out; they are derived and round differently between the download and the database
+RECONCILE_COLUMNS = ['ticker', 'price_close', 'volume', 'trading_value', 'marketcap', 'shares_issued', 'foreign_shareholding']
+RECONCILE_NUMERIC_COLUMNS = RECONCILE_COLUMNS[1:]
+
+
+def krx_checksums(df_data):
+    # DataFrame indexed by data_date with row_count and checksum per date
+    # The checksum is the wrapping uint64 sum of the row hashes, so it does not depend on row order
+    if len(df_data) == 0:
+        return pd.DataFrame({'row_count': pd.Series(dtype='int64'), 'checksum': pd.Series(dtype='uint64')},
+                            index=pd.Index([], name='data_date'))
+    hashes = row_hash(df_data, RECONCILE_COLUMNS, RECONCILE_NUMERIC_COLUMNS)
+    date_codes, data_dates = pd.factorize(pd.to_datetime(df_data['data_date'], format='mixed').dt.date, sort=True)    # date objects or SQL text
+    checksum = np.zeros(len(data_dates), dtype='uint64')
+    np.add.at(checksum, date_codes, hashes)    # uint64 addition wraps around
+    row_count = np.bincount(date_codes, minlength=len(data_dates))
+    return pd.DataFrame({'row_count': row_count, 'checksum': checksum}, index=pd.Index(list(data_dates), name='data_date'))
+
+
+def _krx_stored_chunk(sqlengine, start, end):
+    sql = """
+    SELECT
+        data_date, {columns}
+    FROM krxmarketdata
+    WHERE data_date BETWEEN '{a}' AND '{b}'
+    ;""".format(columns=", ".join(RECONCILE_COLUMNS), a=start.strftime('%Y-%m-%d'), b=end.strftime('%Y-%m-%d'))
+    return krx_checksums(pd.read_sql(sql, con=sqlengine))
+
+
+def krx_stored_checksums(sqlengine, start, end, max_workers=4, chunk='MS'):
+    # krx_checksums of krxmarketdata over [start, end], one query per chunk (default: calendar month) on max_workers
+    # connections; only the checksum columns are read and each chunk is reduced to a few rows before the next is kept
+    start, end = to_date(start), to_date(end)
+    edges = [start] + [day.date() for day in pd.date_range(start, end, freq=chunk) if day.date() > start]
+    bounds = [(first, last - timedelta(1)) for first, last in zip(edges, edges[1:])] + [(edges[-1], end)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        chunks = list(executor.map(lambda bound: _krx_stored_chunk(sqlengine, *bound), bounds))
+    return pd.concat(chunks).sort_index()
+
+
+def krx_repair_date(sqlengine, df_data, data_date, write_method='executemany', store_path=None):
+    # Replace everything stored for data_date with df_data in one transaction and record the new row count in the
+    # watermark table; write_method 'to_sql' falls back to 'executemany', which can share the delete's transaction
+    # Both spellings: SQLite sinks filled before data_date was normalized hold 'YYYY-MM-DD 00:00:00'
+    replace_write(df_data, 'krxmarketdata', sqlengine, "data_date IN ('{0}', '{0} 00:00:00')".format(data_date.strftime('%Y-%m-%d')),
+                  method='load_data' if write_method == 'load_data' else 'executemany')
+    krx_sync_record(sqlengine, {'data_date': data_date, 'status': 'written', 'numtickers': len(df_data)})
+    if store_path is not None:
+        from equitymarketdata.store import krx_store_write
+        krx_store_write(df_data, store_path)
+
+
+def krx_reconcile(sqlengine, start, end, repair=False, sql_workers=4, fetch_workers=4, rate_limit=None, cache=None,
+                  filetype='xls', holidays=None, calendar=None, session=None, write_method='executemany', store_path=None):
+    # Compare krxmarketdata over [start, end] with KRX snapshots (from cache where possible) and, with repair=True,
+    # rewrite the dates that differ. Yields one record per date in date order:
+    # {'data_date', 'status', 'stored_rows', 'fetched_rows', 'repaired'} where status is one of
+    # 'ok', 'missing' (nothing stored), 'extra' (stored, but KRX has no data), 'count_mismatch', 'checksum_mismatch'
+    # or 'foreign_missing' (the snapshot lacks foreign ownership, so it is neither compared nor used for repair)
+    start, end = to_date(start), to_date(end)
+    if repair:
+        krx_sync_create(sqlengine)
+    stored = krx_stored_checksums(sqlengine, start, end, max_workers=sql_workers)
+    dates = pd.date_range(start, end, freq='D')
+    for data_date, df_data in krx_backfill(dates, max_workers=fetch_workers, rate_limit=rate_limit, holidays=holidays,
+                                           session=session, cache=cache, filetype=filetype, calendar=calendar):
+        day = to_date(data_date)
+        record = {'data_date': day, 'status': 'ok', 'stored_rows': 0, 'fetched_rows': 0, 'repaired': False}
+        if day in stored.index:
+            record['stored_rows'] = int(stored.at[day, 'row_count'])
+        if df_data is None or len(df_data) == 0:
+            if record['stored_rows'] > 0:
+                record['status'] = 'extra'
+                yield record
+            continue    # Closed day, nothing stored
+        record['fetched_rows'] = len(df_data)
+        if len(df_data.dropna(subset=['foreign_shareholding', 'foreign_shareholding_pct'])) == 0:
+            record['status'] = 'foreign_missing'
+        elif record['stored_rows'] == 0:
+            record['status'] = 'missing'
+        elif record['stored_rows'] != record['fetched_rows']:
+            record['status'] = 'count_mismatch'
+        elif krx_checksums(df_data)['checksum'].iloc[0] != stored.at[day, 'checksum']:
+            record['status'] = 'checksum_mismatch'
+        if repair and record['status'] in ('missing', 'count_mismatch', 'checksum_mismatch'):
+            krx_repair_date(sqlengine, df_data, day, write_method=write_method, store_path=store_path)
+            record['repaired'] = True
+        yield record
+
+
+def main(argv=None):    # python -m equitymarketdata.reconcile --start 2015-01-01 --end 2024-12-31 --sql-url mysql+mysqldb://... --repair
+    parser = argparse.ArgumentParser(description="Verify krxmarketdata against KRX snapshots and repair the dates that differ")
+    parser.add_argument("--start", type=date.fromisoformat, required=True)
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--sql-url", default=None, help="SQLAlchemy URL; default from the config file or EQUITYMARKETDATA_SQL_* variables")
+    parser.add_argument("--repair", action="store_true")
+    parser.add_argument("--sql-workers", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate-limit", type=float, default=4)
+    parser.add_argument("--cache", default=None, help="response cache directory")
+    parser.add_argument("--store", default=None, help="Parquet store directory repaired along with SQL")
+    parser.add_argument("--calendar", default=None, help="trading calendar file, seeded from krxmarketdata when missing")
+    parser.add_argument("--filetype", choices=['xls', 'csv'], default='xls')
+    args = parser.parse_args(argv)
+
+    cache = None
+    if args.cache is not None:
+        from equitymarketdata.cache import ResponseCache
+        cache = ResponseCache(args.cache)
+    sqlengine = create_sqlengine(args.sql_url)
+    calendar = None
+    if args.calendar is not None:
+        from equitymarketdata.tradingcalendar import krx_trading_calendar
+        calendar = krx_trading_calendar(args.calendar, sqlengine)
+
+    checked = 0
+    unresolved = 0
+    for record in krx_reconcile(sqlengine, args.start, args.end, repair=args.repair, sql_workers=args.sql_workers,
+                                fetch_workers=args.workers, rate_limit=args.rate_limit, cache=cache, filetype=args.filetype,
+                                calendar=calendar, store_path=args.store):
+        checked += 1
+        if record['status'] != 'ok':
+            unresolved += not record['repaired']
+            print("{}: stored {:6d} fetched {:6d} {}{}".format(record['data_date'].strftime('%Y-%m-%d'), record['stored_rows'], record['fetched_rows'],
+                                                               record['status'], " (repaired)" if record['repaired'] else ""))
+    print("{} dates checked, {} unresolved".format(checked, unresolved))
+    return 1 if unresolved else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
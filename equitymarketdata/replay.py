@@ -0,0 +1,195 @@
+import argparse
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from requests.adapters import HTTPAdapter
+
+from equitymarketdata.backfill import krx_is_known_closed
+from equitymarketdata.cache import ResponseCache
+from equitymarketdata.httpclient import RateLimitedSession, RateLimiter, retry_call
+from equitymarketdata.krx import krx_marketdata_fetch
+from equitymarketdata.naver import naverfinance_consensus_fetch
+
+
+def request_key(method, url, body=None):
+    # Recording key of one request: method, path and query plus form parameters, without the host
+    # so the same key is computed for a live endpoint and for the stand-in server replaying it
+    if isinstance(body, bytes):
+        body = body.decode('utf8')
+    parts = urlsplit(url)
+    params = parse_qsl(parts.query, keep_blank_values=True) + parse_qsl(body or '', keep_blank_values=True)
+    return ResponseCache.key(method.upper() + " " + parts.path, dict(params))
+
+
+class ResponseRecording(ResponseCache):
+    # Directory of recorded response bodies keyed by request_key; entries never expire or get evicted
+    def __init__(self, root):
+        super().__init__(root, max_bytes=float('inf'))
+
+    def record(self, method, url, body, content):
+        self.put(request_key(method, url, body), content)
+
+    def lookup(self, method, url, body=None):    # Recorded body of a request, or None
+        cached = self.get(request_key(method, url, body))
+        return None if cached is None else cached[0]
+
+
+class RecordingSession(RateLimitedSession):
+    # Session that stores every successful response in a ResponseRecording while passing it through
+    # Pass it as session= to krx_marketdata_fetch, naverfinance_consensus_fetch or any job taking a session
+    def __init__(self, recording=None, rate_limiter=None):
+        super().__init__(rate_limiter)
+        self.recording = recording
+
+    def request(self, method, url, *args, **kwargs):
+        response = super().request(method, url, *args, **kwargs)
+        if self.recording is not None and response.status_code == 200:
+            self.recording.record(method, response.request.url, response.request.body, response.content)
+        return response
+
+
+class StandInSession(RecordingSession):    # Sends every request to the stand-in server, whatever host the URL names
+    def __init__(self, base_url, rate_limiter=None, recording=None):
+        super().__init__(recording, rate_limiter)
+        self.base_url = base_url
+
+    def request(self, method, url, *args, **kwargs):
+        parts = urlsplit(url)
+        return super().request(method, self.base_url + parts.path + ("?" + parts.query if parts.query else ""), *args, **kwargs)
+
+
+def replay_responder(recording):    # respond() for StandInServer serving a ResponseRecording; unrecorded requests get 404
+    def respond(method, path, body):
+        content = recording.lookup(method, path, body)
+        return (404, b"") if content is None else (200, content)
+    return respond
+
+
+class StandInServer:
+    # Local HTTP server standing in for the KRX and Naver endpoints, on a background thread
+    # respond(method, path_with_query, body) -> (status, content) produces the responses, e.g. replay_responder
+    # Every request waits `latency` seconds (plus up to `jitter` seconds more) and fails with 503 at `error_rate`,
+    # so retries, backoff and slow endpoints can be exercised offline; seed makes the failures repeatable
+    def __init__(self, respond, latency=0.0, jitter=0.0, error_rate=0.0, seed=None, port=0):
+        self.respond = respond
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"    # Keep-alive, like the real servers
+
+            def handle_request(self, method):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with stand_in.lock:
+                    stand_in.requests += 1
+                    delay = stand_in.latency + stand_in.jitter * stand_in.random.random()
+                    failing = stand_in.random.random() < stand_in.error_rate
+                    stand_in.errors += failing
+                time.sleep(delay)
+                status, content = (503, b"") if failing else stand_in.respond(method, self.path, body)
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                self.handle_request("GET")
+
+            def do_POST(self):
+                self.handle_request("POST")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def session(self, pool_size=10, rate_limit=None, recording=None):
+        # Like create_session, but every request goes to this server; with recording, responses are also recorded
+        session = StandInSession(self.url, RateLimiter(rate_limit) if rate_limit else None, recording)
+        session.mount("http://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+        return session
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+def record_krx(recording, dates, filetype='xls', rate_limit=2, retries=3, backoff=1.0):
+    # Record the live KRX downloads of dates (skipping weekends and fixed holidays) into recording
+    session = RecordingSession(recording, RateLimiter(rate_limit))
+    for data_date in dates:
+        if not krx_is_known_closed(data_date):
+            retry_call(krx_marketdata_fetch, data_date.strftime('%Y%m%d'), session=session, filetype=filetype, retries=retries, backoff=backoff)
+
+
+def record_naver(recording, tickers, periods=("Y",), stmnt_types=(0,), rate_limit=2, retries=3, backoff=1.0):
+    # Record the live Naver consensus pages of tickers into recording
+    session = RecordingSession(recording, RateLimiter(rate_limit))
+    for ticker in tickers:
+        for period in periods:
+            for stmnt_type in stmnt_types:
+                retry_call(naverfinance_consensus_fetch, ticker, period, stmnt_type, session=session, retries=retries, backoff=backoff)
+
+
+def main(argv=None):
+    # python -m equitymarketdata.replay record DIR --krx 2020-01-02 2020-01-31 --naver 005930 000660
+    # python -m equitymarketdata.replay serve DIR --port 8080 --latency 0.05 --error-rate 0.01
+    parser = argparse.ArgumentParser(description="Record live KRX/Naver responses, or serve a recording on a local stand-in server")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="record live responses into DIR")
+    record.add_argument("recording")
+    record.add_argument("--krx", nargs=2, metavar=("START", "END"), help="KRX dates to record")
+    record.add_argument("--filetype", default="xls", choices=["xls", "csv"])
+    record.add_argument("--naver", nargs="+", default=[], metavar="TICKER", help="tickers whose consensus pages to record")
+    record.add_argument("--periods", nargs="+", default=["Y"], choices=["Y", "Q"])
+    record.add_argument("--stmnt-types", nargs="+", type=int, default=[0])
+    record.add_argument("--rate-limit", type=float, default=2, help="max requests per second")
+    serve = commands.add_parser("serve", help="serve DIR until interrupted")
+    serve.add_argument("recording")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    serve.add_argument("--jitter", type=float, default=0.0, help="up to this many seconds more, at random")
+    serve.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args(argv)
+
+    recording = ResponseRecording(args.recording)
+    if args.command == "record":
+        if args.krx:
+            import pandas as pd
+            record_krx(recording, pd.bdate_range(args.krx[0], args.krx[1]), args.filetype, args.rate_limit)
+        record_naver(recording, args.naver, args.periods, args.stmnt_types, args.rate_limit)
+        return 0
+    with StandInServer(replay_responder(recording), args.latency, args.jitter, args.error_rate, port=args.port) as server:
+        print("Serving " + args.recording + " on " + server.url + " (Ctrl-C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,388 @@
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from equitymarketdata.naver import NAVER_CONSENSUS_TABLES, naver_period_date
+
+
+# Consensus revision history: one row per change of one figure, without the financial_item text
+# A series is (ticker, financial_item_code, statement_period, accounting_standard, forecast_indication); keys are small
+# integers, statement_period is YYYYMM and value is in hundredths (Naver shows at most two decimals), so it is exact
+# Files are sorted by series and update_date; update_date and value are DELTA_BINARY_PACKED, so a revision costs
+# a few bits for the date gap and the value change, and the key columns collapse into run-length encoded runs
+CONSENSUS_REVISION_SCHEMA = pa.schema([
+    ('financial_item_code', pa.int16()),
+    ('statement_period', pa.int32()),
+    ('accounting_standard', pa.int8()),    # ACCOUNTING_STANDARD_KEYS code; 0 when the page named none or an unknown one
+    ('forecast_indication', pa.int8()),    # 1 for 'E', 0 for 'A'
+    ('ticker', pa.dictionary(pa.int32(), pa.string())),
+    ('update_date', pa.date32()),
+    ('value', pa.int64())    # Hundredths of the value in ones; null for a blank figure
+])
+REVISION_KEY_COLUMNS = CONSENSUS_REVISION_SCHEMA.names[:5]
+REVISION_VALUE_SCALE = 100
+REVISION_BASE_FILE = "base.parquet"    # Compacted history
+REVISION_SEGMENT_PREFIX = "segment-"    # Appended since the last compaction, merged on read
+REVISION_ROW_GROUP = 128 * 1024    # Rows are sorted by item first, so an item filter skips most row groups
+
+# Bit layout of the int64 series key, highest first: item | period | standard | forecast | ticker
+# Sorting by the key gives the file order above; months are counted from 1900, tickers are dictionary positions
+KEY_TICKER_BITS = 24
+KEY_FORECAST_BITS = 1
+KEY_STANDARD_BITS = 4
+KEY_PERIOD_BITS = 12
+DAY_BITS = 32    # rank = series position << DAY_BITS | days since 1970
+
+
+def revision_path(root, period):    # root/period=Y, one revision store per consensus table
+    return os.path.join(root, "period={}".format(period))
+
+
+def revision_period_code(statement_period):    # date -> YYYYMM
+    timestamp = pd.Timestamp(statement_period)
+    return timestamp.year * 100 + timestamp.month
+
+
+def consensus_revision_encode(df_consensus):
+    # Revision rows (CONSENSUS_REVISION_SCHEMA) from consensus rows as parsed or read from SQL
+    # Rows of items without a financial_item_code cannot be keyed and are left out
+    df = df_consensus[pd.to_numeric(df_consensus['financial_item_code'], errors='coerce').notna()]
+    statement_period = pd.to_datetime(df['statement_period'])
+    value = pd.to_numeric(df['value'], errors='coerce').to_numpy(dtype='float64') * REVISION_VALUE_SCALE
+    df = pd.DataFrame({
+        'financial_item_code': pd.to_numeric(df['financial_item_code']).to_numpy(dtype='int16'),
+        'statement_period': (statement_period.dt.year * 100 + statement_period.dt.month).to_numpy(dtype='int32'),
+        'accounting_standard': pd.to_numeric(df['accounting_standard'], errors='coerce').fillna(0).to_numpy(dtype='int8'),
+        'forecast_indication': (df['forecast_indication'] == 'E').to_numpy(dtype='int8'),
+        'ticker': df['ticker'].astype(str).to_numpy(dtype=object),
+        'update_date': pd.to_datetime(df['update_date']).to_numpy(dtype='datetime64[D]'),
+        'value': np.round(value)
+    }).sort_values(REVISION_KEY_COLUMNS + ['update_date'], kind='stable')
+    arrays = [pa.array(df[name].to_numpy()) for name in REVISION_KEY_COLUMNS[:4]]
+    arrays.append(pa.array(df['ticker'].to_numpy(), type=pa.string()).dictionary_encode())
+    arrays.append(pa.array(df['update_date'].to_numpy(dtype='datetime64[D]'), type=pa.date32()))
+    arrays.append(pa.array(df['value'].to_numpy(), type=pa.int64(), mask=df['value'].isna().to_numpy(), safe=False))
+    return pa.Table.from_arrays(arrays, schema=CONSENSUS_REVISION_SCHEMA)
+
+
+def revision_write(table, path):    # Parquet file with the encodings of CONSENSUS_REVISION_SCHEMA, written atomically
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, path + ".tmp", compression='zstd', row_group_size=REVISION_ROW_GROUP,
+                   use_dictionary=REVISION_KEY_COLUMNS, column_encoding={'update_date': 'DELTA_BINARY_PACKED', 'value': 'DELTA_BINARY_PACKED'})
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def revision_files(root):    # Base file first, then the segments in the order they were appended
+    if not os.path.isdir(root):
+        return []
+    segments = sorted(name for name in os.listdir(root) if name.startswith(REVISION_SEGMENT_PREFIX) and name.endswith(".parquet"))
+    base = [REVISION_BASE_FILE] if os.path.exists(os.path.join(root, REVISION_BASE_FILE)) else []
+    return [os.path.join(root, name) for name in base + segments]
+
+
+def consensus_revision_append(root, df_consensus):
+    # Save consensus rows (e.g. the changed rows consensus_diff returns) as a new segment; nothing is read back
+    # Rows that repeat the latest value of their series are dropped when the store is read or compacted
+    table = consensus_revision_encode(df_consensus)
+    if len(table) == 0:
+        return None
+    files = revision_files(root)
+    last = os.path.basename(files[-1]) if files else ""
+    number = int(last[len(REVISION_SEGMENT_PREFIX):-len(".parquet")]) + 1 if last.startswith(REVISION_SEGMENT_PREFIX) else 1
+    return revision_write(table, os.path.join(root, "{}{:08d}.parquet".format(REVISION_SEGMENT_PREFIX, number)))
+
+
+def consensus_revision_read(root, item_codes=None):
+    # All stored revision rows (base and segments) as one pyarrow Table with a single ticker dictionary
+    # item_codes limits the read to those items; row groups of other items are skipped by their statistics
+    row_filter = None if item_codes is None else [('financial_item_code', 'in', [int(code) for code in item_codes])]
+    tables = [pq.read_table(path, filters=row_filter, schema=CONSENSUS_REVISION_SCHEMA) for path in revision_files(root)]
+    if not tables:
+        return CONSENSUS_REVISION_SCHEMA.empty_table()
+    return pa.concat_tables(tables).unify_dictionaries().combine_chunks()
+
+
+def _series_key(item, period, standard, forecast, ticker):    # int64 key with the bit layout above
+    months = (period // 100 - 1900) * 12 + period % 100 - 1
+    key = item.astype('int64')
+    key = (key << KEY_PERIOD_BITS) | months
+    key = (key << KEY_STANDARD_BITS) | standard
+    key = (key << KEY_FORECAST_BITS) | forecast
+    return (key << KEY_TICKER_BITS) | ticker
+
+
+def _series_fields(key):    # Inverse of _series_key: (item, period, standard, forecast, ticker)
+    ticker = key & ((1 << KEY_TICKER_BITS) - 1)
+    key = key >> KEY_TICKER_BITS
+    forecast = key & ((1 << KEY_FORECAST_BITS) - 1)
+    key = key >> KEY_FORECAST_BITS
+    standard = key & ((1 << KEY_STANDARD_BITS) - 1)
+    key = key >> KEY_STANDARD_BITS
+    months = key & ((1 << KEY_PERIOD_BITS) - 1)
+    period = (months // 12 + 1900) * 100 + months % 12 + 1
+    return key >> KEY_PERIOD_BITS, period, standard, forecast, ticker
+
+
+def _drop_repeats(key, days, values, valid, keep=None):
+    # Rows to keep of arrays sorted by (key, days): one row per series and day (the later one), and no row that
+    # repeats the value before it in its series
+    keep = np.ones(len(key), dtype=bool) if keep is None else keep
+    keep[:-1] &= (key[1:] != key[:-1]) | (days[1:] != days[:-1])
+    position = np.flatnonzero(keep)
+    same_series = key[position[1:]] == key[position[:-1]]
+    same_value = (valid[position[1:]] == valid[position[:-1]]) & ((values[position[1:]] == values[position[:-1]]) | ~valid[position[1:]])
+    keep[position[1:][same_series & same_value]] = False
+    return keep
+
+
+def revision_arrays(table):
+    # Sorted, de-duplicated numpy arrays of a revision table: (key, days, values, valid, tickers)
+    # Later rows win for the same series and day, so a segment appended twice or a base left next to its merged
+    # segments after a crash reads the same as one clean copy
+    if len(table) == 0:
+        empty = np.zeros(0, dtype='int64')
+        return empty, empty, empty, np.zeros(0, dtype=bool), np.zeros(0, dtype=object)
+    ticker = table.column('ticker').chunk(0)
+    tickers = ticker.dictionary.to_numpy(zero_copy_only=False)
+    key = _series_key(*(table.column(name).to_numpy().astype('int64') for name in REVISION_KEY_COLUMNS[:4]),
+                      ticker.indices.to_numpy().astype('int64'))
+    days = table.column('update_date').to_numpy().astype('datetime64[D]').astype('int64')
+    value = table.column('value')
+    valid = value.is_valid().to_numpy(zero_copy_only=False)
+    values = value.fill_null(0).to_numpy()    # Exact int64; a float array would round large amounts
+    order = np.lexsort((days, key))    # Stable, so rows of later files stay after earlier ones on the same day
+    key, days, values, valid = key[order], days[order], values[order], valid[order]
+    keep = _drop_repeats(key, days, values, valid)
+    return key[keep], days[keep], values[keep], valid[keep], tickers
+
+
+def revision_table(key, days, values, valid, tickers):    # Inverse of revision_arrays, with a sorted ticker dictionary
+    item, period, standard, forecast, ticker = _series_fields(key)
+    used, codes = np.unique(ticker, return_inverse=True)
+    dictionary = tickers[used]
+    order = np.argsort(dictionary, kind='stable')
+    rank = np.empty(len(order), dtype='int64')
+    rank[order] = np.arange(len(order))
+    codes = rank[codes]    # Positions in the sorted dictionary, so the file is sorted by ticker within each block
+    dictionary = pa.array(dictionary[order], type=pa.string())
+    order = np.lexsort((days, _series_key(item, period, standard, forecast, codes)))
+    arrays = [
+        pa.array(item[order].astype('int16')),
+        pa.array(period[order].astype('int32')),
+        pa.array(standard[order].astype('int8')),
+        pa.array(forecast[order].astype('int8')),
+        pa.DictionaryArray.from_arrays(pa.array(codes[order].astype('int32')), dictionary),
+        pa.array(days[order].astype('datetime64[D]'), type=pa.date32()),
+        pa.array(values[order], type=pa.int64(), mask=~valid[order])
+    ]
+    return pa.Table.from_arrays(arrays, schema=CONSENSUS_REVISION_SCHEMA)
+
+
+def consensus_revision_compact(root, before=None):
+    # Merge the segments into the base file; returns (rows read, rows kept)
+    # before (a date) also thins older history to the last revision of each series per calendar month, so as-of
+    # figures at month ends stay exact while the revisions within those months are dropped
+    files = revision_files(root)
+    if not files:
+        return 0, 0
+    table = consensus_revision_read(root)
+    key, days, values, valid, tickers = revision_arrays(table)
+    if before is not None and len(key):
+        old = days < np.datetime64(pd.Timestamp(before), 'D').astype('int64')
+        month = days.astype('datetime64[D]').astype('datetime64[M]').astype('int64')
+        keep = np.ones(len(key), dtype=bool)
+        keep[:-1] = ~(old[:-1] & old[1:] & (key[1:] == key[:-1]) & (month[1:] == month[:-1]))
+        keep = _drop_repeats(key, days, values, valid, keep)    # A value can come back within a month: A, B, A
+        key, days, values, valid = key[keep], days[keep], values[keep], valid[keep]
+    revision_write(revision_table(key, days, values, valid, tickers), os.path.join(root, REVISION_BASE_FILE))
+    for path in files:    # The base now holds every merged segment
+        if os.path.basename(path) != REVISION_BASE_FILE:
+            os.remove(path)
+    return len(table), len(key)
+
+
+def consensus_revision_import_sql(sqlengine, root, period="Y", start=None, end=None):
+    # Copy the history of a consensus table into the revision store, one year of update_date per query, then compact
+    table_name = NAVER_CONSENSUS_TABLES[period]
+    if start is None or end is None:
+        bounds = pd.read_sql("SELECT MIN(update_date) AS first, MAX(update_date) AS last FROM {t};".format(t=table_name), con=sqlengine)
+        if bounds['first'].isna().iloc[0]:
+            return 0, 0
+        start = pd.Timestamp(bounds['first'].iloc[0]).date() if start is None else start
+        end = pd.Timestamp(bounds['last'].iloc[0]).date() if end is None else end
+    for year in range(start.year, end.year + 1):
+        sql = """
+        SELECT
+            ticker, statement_period, accounting_standard, financial_item_code, forecast_indication, value, update_date
+        FROM {t}
+        WHERE update_date BETWEEN '{a}' AND '{b}'
+        ;""".format(t=table_name, a=max(date(year, 1, 1), start).strftime('%Y-%m-%d'), b=min(date(year, 12, 31), end).strftime('%Y-%m-%d'))
+        df_year = pd.read_sql(sql, con=sqlengine)
+        consensus_revision_append(root, df_year)
+        print(str(year) + ": " + str(len(df_year)) + " rows imported")
+    return consensus_revision_compact(root)
+
+
+class ConsensusRevisionIndex:
+    # In-memory index over a revision store for point-in-time and revision queries across every ticker
+    # Revisions are sorted by series and update_date and addressed by rank = series position << 32 | day, so the
+    # figure of any set of series as of a date is one vectorized binary search, and revision counts between two
+    # dates are differences of running totals at two such positions
+    def __init__(self, table):
+        key, days, self.values, self.valid, self.tickers = revision_arrays(table)
+        new_series = np.ones(len(key), dtype=bool)
+        new_series[1:] = key[1:] != key[:-1]
+        self.starts = np.flatnonzero(new_series)
+        self.ends = np.append(self.starts[1:], len(key))
+        self.item, self.period, self.standard, self.forecast, self.ticker = _series_fields(key[self.starts])
+        series = np.cumsum(new_series) - 1
+        self.rank = (series << DAY_BITS) | days
+
+        # Direction of each revision against the one before it in its series (0 for the first and for blanks)
+        previous_same = ~new_series    # The first row always starts a series
+        both_valid = np.zeros(len(key), dtype=bool)
+        both_valid[1:] = previous_same[1:] & self.valid[1:] & self.valid[:-1]
+        step = np.zeros(len(key), dtype='int64')
+        step[1:] = np.sign(self.values[1:] - self.values[:-1])
+        step[~both_valid] = 0
+        self.upgrades = np.concatenate([[0], np.cumsum(step > 0)]).astype('int32')
+        self.downgrades = np.concatenate([[0], np.cumsum(step < 0)]).astype('int32')
+        self.ticker_index = pd.Index(self.tickers)
+
+    @classmethod
+    def load(cls, root, item_codes=None):    # Index over the store at root, optionally only some items
+        return cls(consensus_revision_read(root, item_codes))
+
+    def __len__(self):
+        return len(self.rank)
+
+    def series(self, tickers=None, item_code=None, statement_period=None, accounting_standard=None, forecast_indication=None):
+        # Positions of the series matching every filter that is given
+        mask = np.ones(len(self.starts), dtype=bool)
+        if tickers is not None:
+            codes = self.ticker_index.get_indexer([tickers] if isinstance(tickers, str) else list(tickers))
+            mask &= np.isin(self.ticker, codes[codes >= 0])
+        if item_code is not None:
+            mask &= self.item == int(item_code)
+        if statement_period is not None:
+            mask &= self.period == revision_period_code(statement_period)
+        if accounting_standard is not None:
+            mask &= self.standard == int(accounting_standard)
+        if forecast_indication is not None:
+            mask &= self.forecast == int(forecast_indication == 'E')
+        return np.flatnonzero(mask)
+
+    def _position(self, series, as_of):    # Row of each series' last revision on or before as_of; -1 when there is none
+        if as_of is None:
+            return self.ends[series] - 1
+        day = np.datetime64(pd.Timestamp(as_of), 'D').astype('int64')
+        position = np.searchsorted(self.rank, (series.astype('int64') << DAY_BITS) | day, side='right') - 1
+        return np.where(position >= self.starts[series], position, -1)
+
+    def _values(self, position):    # Values in ones, NaN for blanks and missing rows
+        value = self.values[position] / REVISION_VALUE_SCALE
+        return np.where((position >= 0) & self.valid[position], value, np.nan)
+
+    def _frame(self, series, columns):    # Series keys in the consensus table's layout, followed by columns
+        periods = self.period[series]
+        frame = pd.DataFrame({
+            'ticker': self.tickers[self.ticker[series]],
+            'statement_period': [naver_period_date(int(period // 100), int(period % 100)) for period in periods],
+            'accounting_standard': self.standard[series],
+            'financial_item_code': self.item[series],
+            'forecast_indication': np.where(self.forecast[series] == 1, 'E', 'A')
+        })
+        for name, column in columns.items():
+            frame[name] = column
+        return frame
+
+    def as_of(self, as_of=None, **filters):
+        # Figures as they were known on as_of (None for the latest) of every series matching filters (see series)
+        series = self.series(**filters)
+        position = self._position(series, as_of)
+        found = position >= 0
+        series, position = series[found], position[found]
+        update_date = (self.rank[position] & ((1 << DAY_BITS) - 1)).astype('datetime64[D]')
+        return self._frame(series, {'value': self._values(position), 'update_date': update_date})
+
+    def trajectory(self, ticker, item_code, start=None, end=None, **filters):
+        # Every revision of one ticker's item within [start, end], series by series in update_date order
+        series = self.series(tickers=ticker, item_code=item_code, **filters)
+        lo, hi = self.starts[series], self.ends[series]
+        if start is not None:
+            lo = np.searchsorted(self.rank, (series.astype('int64') << DAY_BITS) | np.datetime64(pd.Timestamp(start), 'D').astype('int64'), side='left')
+        if end is not None:
+            hi = np.searchsorted(self.rank, (series.astype('int64') << DAY_BITS) | np.datetime64(pd.Timestamp(end), 'D').astype('int64'), side='right')
+        counts = np.maximum(hi - lo, 0)
+        position = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        update_date = (self.rank[position] & ((1 << DAY_BITS) - 1)).astype('datetime64[D]')
+        return self._frame(np.repeat(series, counts), {'value': self._values(position), 'update_date': update_date})
+
+    def momentum(self, start, end=None, item_code=None, forecast_indication='E', **filters):
+        # Revision momentum of every matching series between start and end (None for the latest): figures as of both
+        # dates, their change, and the number of upward and downward revisions made in (start, end]
+        series = self.series(item_code=item_code, forecast_indication=forecast_indication, **filters)
+        first = self._position(series, start)
+        last = self._position(series, end)
+        value_start, value_end = self._values(first), self._values(last)
+        lo = np.where(first >= 0, first + 1, self.starts[series])
+        hi = np.where(last >= 0, last + 1, self.starts[series])
+        upgrades = self.upgrades[hi] - self.upgrades[lo]
+        downgrades = self.downgrades[hi] - self.downgrades[lo]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change_pct = (value_end - value_start) / np.abs(value_start) * 100
+            revision_ratio = (upgrades - downgrades) / (upgrades + downgrades)
+        frame = self._frame(series, {'value_start': value_start, 'value_end': value_end, 'change_pct': change_pct,
+                                     'upgrades': upgrades, 'downgrades': downgrades, 'revision_ratio': revision_ratio})
+        return frame[(last >= 0) | (first >= 0)].reset_index(drop=True)
+
+
+def main(argv=None):
+    # python -m equitymarketdata.revisions import|compact|momentum --root consensus_revisions [--period Y] ...
+    parser = argparse.ArgumentParser(description="Consensus revision store: import from SQL, compact, query revision momentum")
+    parser.add_argument("command", choices=["import", "compact", "momentum"])
+    parser.add_argument("--root", required=True, help="revision store directory (one subdirectory per period)")
+    parser.add_argument("--period", default="Y", choices=list(NAVER_CONSENSUS_TABLES), help="consensus period")
+    parser.add_argument("--config", default=None, help="ini file with the [sql] settings, for import")
+    parser.add_argument("--sql-url", default=None, help="SQLAlchemy URL, for import (default: from the config)")
+    parser.add_argument("--before", type=date.fromisoformat, default=None, help="compact: thin history before this date to month ends")
+    parser.add_argument("--item", type=int, default=None, help="momentum: financial_item_code (e.g. 4165 for EPS)")
+    parser.add_argument("--statement-period", type=date.fromisoformat, default=None, help="momentum: statement period, e.g. 2021-12-31")
+    parser.add_argument("--start", type=date.fromisoformat, default=None, help="momentum: first date")
+    parser.add_argument("--end", type=date.fromisoformat, default=None, help="momentum: last date (default: latest)")
+    parser.add_argument("--top", type=int, default=20, help="momentum: rows to print from each end")
+    args = parser.parse_args(argv)
+    root = revision_path(args.root, args.period)
+
+    started = time.perf_counter()
+    if args.command == "import":
+        from equitymarketdata.config import load_config
+        from equitymarketdata.db import create_sqlengine
+        rows = consensus_revision_import_sql(create_sqlengine(args.sql_url, config=load_config(args.config)), root, args.period)
+        print("{} rows read, {} revisions kept in {:.1f}s".format(rows[0], rows[1], time.perf_counter() - started))
+    elif args.command == "compact":
+        rows = consensus_revision_compact(root, args.before)
+        print("{} rows read, {} revisions kept in {:.1f}s".format(rows[0], rows[1], time.perf_counter() - started))
+    else:
+        if args.item is None or args.start is None:
+            parser.error("momentum needs --item and --start")
+        index = ConsensusRevisionIndex.load(root, item_codes=[args.item])
+        loaded = time.perf_counter()
+        df = index.momentum(args.start, args.end, item_code=args.item, statement_period=args.statement_period)
+        df = df.dropna(subset=['change_pct']).sort_values('change_pct', ascending=False)
+        print("{} revisions loaded in {:.2f}s, {} series ranked in {:.3f}s".format(len(index), loaded - started, len(df), time.perf_counter() - loaded))
+        with pd.option_context('display.width', 200, 'display.max_columns', None):
+            print(pd.concat([df.head(args.top), df.tail(args.top)]).drop_duplicates().to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from equitymarketdata.diff import consensus_diff, consensus_row_hash, sorted_row_hash
+from equitymarketdata.httpclient import create_session, retry_call
+from equitymarketdata.naver import NAVER_CONSENSUS_TABLES, naverfinance_consensus_create_tables, naverfinance_consensus_fetch, naverfinance_consensus_latest, naverfinance_consensus_parse
+from equitymarketdata.parsepool import ParsePool
+from equitymarketdata.revisions import consensus_revision_append, revision_path
+from equitymarketdata.sink import bulk_write
+from equitymarketdata.timing import StageTimer
+
+
+def checkpoint_open(path, header):
+    # Open an append-only checkpoint file; returns (file, set of items already done)
+    # The first line records the run parameters so that a checkpoint from a different run is never resumed
+    done = set()
+    if os.path.exists(path):
+        with open(path, 'r', encoding='UTF8') as fd:
+            lines = fd.read().splitlines()
+        if lines and json.loads(lines[0]) == header:
+            done = set(lines[1:])
+            print("Resuming from checkpoint " + path + ": " + str(len(done)) + " already done")
+            return open(path, 'a', encoding='UTF8'), done
+        print("Checkpoint " + path + " belongs to a different run. Starting over.")
+    fd = open(path, 'w', encoding='UTF8')
+    fd.write(json.dumps(header) + "\n")
+    fd.flush()
+    return fd, done
+
+
+def checkpoint_mark(fd, item):    # Durably record one finished item
+    fd.write(item + "\n")
+    fd.flush()
+    os.fsync(fd.fileno())
+
+
+def naverfinance_consensus_batch(tickers, periods, stmnt_types, update_date, sqlengine, max_workers=4, rate_limit=2,
+                                 retries=3, backoff=1.0, checkpoint_path=None, session=None, write_method='executemany',
+                                 cache=None, batch_rows=20000, parse_workers=0, timer=None, revisions_path=None):
+    # Scrape every ticker x period x statement type in one job: one preload per period table, one worker pool and
+    # HTTP session for all pages, and batched diff and writes per period (NAVER_CONSENSUS_TABLES)
+    # Workers fetch and parse; this thread diffs a period's pending pages against that period's latest rows once
+    # batch_rows rows have accumulated, which also drops the figures several statement types report alike
+    # parse_workers > 0 parses pages on that many processes (ParsePool) while the worker threads keep fetching
+    # timer (a StageTimer or RunMetrics) collects stage latencies, retries, rows written and skipped by the diff, and
+    # failed pages; one is created and reported when not given
+    # revisions_path also appends every written batch to the consensus revision store there (one store per period)
+    # Returns list of (ticker, period, stmnt_type) that failed
+    if session is None:
+        session = create_session(pool_size=max_workers, rate_limit=rate_limit)
+    report = timer is None
+    timer = StageTimer() if timer is None else timer
+    checkpoint = None
+    done = set()
+    if checkpoint_path is not None:
+        header = {'update_date': str(update_date), 'periods': list(periods), 'stmnt_types': list(stmnt_types)}
+        checkpoint, done = checkpoint_open(checkpoint_path, header)
+    # Ticker-major order keeps the pages of one ticker close together, so its statement types meet in the same batch
+    jobs = [(ticker, period, stmnt_type) for ticker in tickers for period in periods for stmnt_type in stmnt_types
+            if "{}|{}|{}".format(ticker, period, stmnt_type) not in done]
+
+    naverfinance_consensus_create_tables(sqlengine, periods)
+    existing_hash = {}    # period -> sorted hashes of the latest rows, grown by every write
+    with timer.time('preload'):
+        for period in periods:
+            existing_hash[period] = sorted_row_hash(naverfinance_consensus_latest(sqlengine, NAVER_CONSENSUS_TABLES[period]))
+    pending = {period: [] for period in periods}    # period -> [(job, parsed DataFrame)] not yet written
+
+    def scrape_page(job):
+        ticker, period, stmnt_type = job
+        with timer.time('fetch'):
+            content = retry_call(naverfinance_consensus_fetch, ticker, period, stmnt_type, session=session, cache=cache, retries=retries, backoff=backoff, timer=timer)
+        with timer.time('parse'):
+            if pool is not None:
+                return pool.parse(naverfinance_consensus_parse, content, ticker, update_date)
+            return naverfinance_consensus_parse(content, ticker, update_date)
+
+    def flush(period):
+        if not pending[period]:
+            return
+        rows = sum(len(df) for _, df in pending[period])
+        with timer.time('diff'):
+            df_consensus = consensus_diff(pd.concat([df for _, df in pending[period]], ignore_index=True), existing_hash=existing_hash[period])
+        with timer.time('write'):
+            bulk_write(df_consensus, NAVER_CONSENSUS_TABLES[period], sqlengine, method=write_method)
+        if revisions_path is not None:
+            with timer.time('revisions'):
+                consensus_revision_append(revision_path(revisions_path, period), df_consensus)
+        timer.count('rows_written', len(df_consensus))
+        timer.count('rows_skipped', rows - len(df_consensus))    # Unchanged since the latest stored update
+        timer.event('naver_flush', period=period, pages=len(pending[period]), rows=rows, written=len(df_consensus))
+        existing_hash[period] = np.union1d(existing_hash[period], consensus_row_hash(df_consensus))
+        if checkpoint is not None:
+            for job, _ in pending[period]:
+                checkpoint_mark(checkpoint, "{}|{}|{}".format(*job))
+        pending[period] = []
+
+    failed = []
+    download_count = 0
+    ticker_pages = Counter(job[0] for job in jobs)    # ticker -> pages not finished yet; a ticker completes at 0
+    failed_tickers = set()
+    tickers_completed = 0    # Tickers whose pages all succeeded in this run
+    start = time.perf_counter()
+    window = max_workers * 2    # Bound on pages in flight or finished but not yet parsed
+    pool = ParsePool(parse_workers) if parse_workers > 0 else None
+    job_iter = iter(jobs)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            while True:
+                while len(running) < window:
+                    job = next(job_iter, None)
+                    if job is None:
+                        break
+                    running[executor.submit(scrape_page, job)] = job
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job = running.pop(future)
+                    download_count += 1
+                    ticker_pages[job[0]] -= 1
+                    try:
+                        df = future.result()
+                    except Exception as e:    # One bad page must not stop the run; the page is retried on resume
+                        failed.append(job)
+                        timer.count('pages_failed')
+                        timer.event('naver_page_failed', ticker=job[0], period=job[1], stmnt_type=job[2], error=repr(e))
+                        print("{} {} {}: failed ({})".format(*job, repr(e)))
+                        failed_tickers.add(job[0])
+                        continue
+                    timer.count('pages_fetched')
+                    if ticker_pages[job[0]] == 0 and job[0] not in failed_tickers:
+                        tickers_completed += 1
+                        timer.count('tickers_completed')
+                    timer.count('rows_parsed', len(df))
+                    pending[job[1]].append((job, df))
+                    if sum(len(df) for _, df in pending[job[1]]) >= batch_rows:
+                        flush(job[1])
+                    if download_count % 100 == 0:
+                        print(str(download_count) + " of " + str(len(jobs)) + " pages downloaded")
+            for period in periods:
+                flush(period)
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+            if pool is not None:
+                pool.shutdown()
+
+    elapsed = time.perf_counter() - start
+    per_minute = 60 / elapsed if elapsed else 0.0
+    print("\n{} tickers in {:.1f}s ({:.1f} tickers/min); {} pages ({:.1f} pages/min), {} failed".format(
+        tickers_completed, elapsed, tickers_completed * per_minute, download_count, download_count * per_minute, len(failed)))
+    if report:
+        timer.report()
+    return failed
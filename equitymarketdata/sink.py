@@ -0,0 +1,142 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+WRITE_METHODS = ['to_sql', 'executemany', 'load_data']
+
+
+def _placeholder(sqlengine):    # DBAPI parameter marker of the engine's driver (MySQLdb: %s, sqlite3: ?)
+    return '?' if sqlengine.dialect.paramstyle == 'qmark' else '%s'
+
+
+def _rows(df):    # Plain Python tuples for DBAPI drivers: NaN/NaT -> None, numpy scalars -> Python scalars
+    columns = []
+    for name in df.columns:
+        series = df[name]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = np.array(series.dt.to_pydatetime(), dtype=object)
+        else:
+            values = series.to_numpy(dtype=object, copy=True)
+        values[pd.isna(values)] = None
+        if any(isinstance(value, np.generic) for value in values[:1]):    # Drivers such as MySQLdb cannot escape numpy scalars
+            values = [value.item() if isinstance(value, np.generic) else value for value in values]
+        columns.append(values)
+    return list(zip(*columns))
+
+
+def _insert_sql(sqlengine, table, columns, upsert_keys):
+    column_list = ", ".join(columns)
+    marks = ", ".join([_placeholder(sqlengine)] * len(columns))
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(table, column_list, marks)
+    if upsert_keys is None:
+        return sql
+    updates = [column for column in columns if column not in upsert_keys]
+    if sqlengine.dialect.name == 'mysql':
+        return sql + " ON DUPLICATE KEY UPDATE " + ", ".join("{0} = VALUES({0})".format(column) for column in updates)
+    return sql + " ON CONFLICT ({}) DO UPDATE SET ".format(", ".join(upsert_keys)) + ", ".join("{0} = excluded.{0}".format(column) for column in updates)
+
+
+def _write_executemany(df, table, connection, sqlengine, upsert_keys):
+    cursor = connection.cursor()
+    try:
+        cursor.executemany(_insert_sql(sqlengine, table, df.columns.tolist(), upsert_keys), _rows(df))    # MySQLdb folds this into multi-row INSERTs
+    finally:
+        cursor.close()
+
+
+def _load_data_field(value):    # One field in LOAD DATA's default text format
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+def _write_load_data(df, table, connection, sqlengine, upsert_keys):
+    # MySQL only; the engine must be created with connect_args={'local_infile': 1}
+    if sqlengine.dialect.name != 'mysql':
+        raise ValueError("load_data is only supported for MySQL")
+    fd, path = tempfile.mkstemp(suffix='.tsv')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf8', newline='') as f:
+            for row in _rows(df):
+                f.write("\t".join(_load_data_field(value) for value in row) + "\n")
+        cursor = connection.cursor()
+        try:
+            cursor.execute("LOAD DATA LOCAL INFILE '{}' {} INTO TABLE {} CHARACTER SET utf8 FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({})".format(
+                path.replace('\\', '/'), '' if upsert_keys is None else 'REPLACE', table, ", ".join(df.columns)))
+        finally:
+            cursor.close()
+    finally:
+        os.remove(path)
+
+
+def bulk_write(df, table, sqlengine, method='executemany', batch_size=5000, upsert_keys=None):
+    # Append df to table, committing one transaction per batch of batch_size rows
+    # method: 'executemany' (multi-row INSERT), 'load_data' (MySQL LOAD DATA LOCAL INFILE) or 'to_sql' (pandas, for comparison)
+    # upsert_keys (e.g. ['ticker', 'data_date']) replaces existing rows with the same key instead of adding duplicates;
+    # the table needs a unique index on those columns (see ensure_unique_key)
+    if method not in WRITE_METHODS:
+        raise ValueError("method must be one of " + ", ".join(WRITE_METHODS))
+    if len(df) == 0:
+        return 0
+    if method == 'to_sql':
+        if upsert_keys is not None:
+            raise ValueError("to_sql does not support upsert_keys")
+        df.to_sql(name=table, con=sqlengine, if_exists='append', index=False, chunksize=batch_size)
+        return len(df)
+
+    write_batch = _write_executemany if method == 'executemany' else _write_load_data
+    connection = sqlengine.raw_connection()
+    try:
+        for start in range(0, len(df), batch_size):
+            try:
+                write_batch(df.iloc[start:start + batch_size], table, connection, sqlengine, upsert_keys)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+    finally:
+        connection.close()
+    return len(df)
+
+
+def replace_write(df, table, sqlengine, where, method='executemany', batch_size=5000):
+    # Delete the rows of table matching the SQL condition `where` and insert df, in one transaction on one connection:
+    # a failed insert or a killed process leaves the old rows in place instead of none
+    if method not in ('executemany', 'load_data'):
+        raise ValueError("method must be 'executemany' or 'load_data'")
+    write_batch = _write_executemany if method == 'executemany' else _write_load_data
+    connection = sqlengine.raw_connection()
+    try:
+        try:
+            cursor = connection.cursor()
+            cursor.execute("DELETE FROM {} WHERE {}".format(table, where))
+            cursor.close()
+            for start in range(0, len(df), batch_size):
+                write_batch(df.iloc[start:start + batch_size], table, connection, sqlengine, None)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+    finally:
+        connection.close()
+    return len(df)
+
+
+def ensure_unique_key(sqlengine, table, keys, name=None):    # Unique index that upsert_keys relies on
+    name = name or "uq_{}_{}".format(table, "_".join(keys))
+    connection = sqlengine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if sqlengine.dialect.name == 'mysql':
+            cursor.execute("SHOW INDEX FROM {} WHERE Key_name = '{}'".format(table, name))
+            if cursor.fetchone() is None:
+                cursor.execute("ALTER TABLE {} ADD UNIQUE KEY {} ({})".format(table, name, ", ".join(keys)))
+        else:
+            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} ({})".format(name, table, ", ".join(keys)))
+        cursor.close()
+        connection.commit()
+    finally:
+        connection.close()
@@ -0,0 +1,67 @@
+from equitymarketdata.db import create_sqlengine
+from equitymarketdata.naver import NAVER_CONSENSUS_TABLES
+from equitymarketdata.sync import KRX_SYNC_DDL
+
+
+# Local SQLite stand-in for the MySQL marketdata database, with the tables the KRX and Naver jobs write to
+# Column order matches the parsed frames, so bulk_write can insert them as they are
+KRX_MARKETDATA_DDL = """
+CREATE TABLE IF NOT EXISTS krxmarketdata (
+    ticker VARCHAR(12) NOT NULL,
+    company_name VARCHAR(100),
+    data_date DATE NOT NULL,
+    price_close BIGINT,
+    price_change BIGINT,
+    price_change_pct DOUBLE,
+    volume BIGINT,
+    trading_value BIGINT,
+    price_open BIGINT,
+    price_high BIGINT,
+    price_low BIGINT,
+    marketcap BIGINT,
+    market_weight_pct DOUBLE,
+    shares_issued BIGINT,
+    foreign_shareholding BIGINT,
+    foreign_shareholding_pct DOUBLE,
+    PRIMARY KEY (data_date, ticker)
+)"""
+NAVER_CONSENSUS_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    ticker VARCHAR(12) NOT NULL,
+    statement_period DATE,
+    accounting_standard VARCHAR(20),
+    financial_item_code DOUBLE,
+    forecast_indication VARCHAR(1),
+    financial_item VARCHAR(100),
+    value DOUBLE,
+    update_date DATE
+)"""
+NAVER_CONSENSUS_INDEX = "CREATE INDEX IF NOT EXISTS ix_{table}_ticker ON {table} (ticker, update_date)"
+
+
+def sqlite_create_tables(sqlengine, periods=("Y",)):    # KRX, sync and consensus tables of the given periods
+    connection = sqlengine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(KRX_MARKETDATA_DDL)
+        cursor.execute(KRX_SYNC_DDL)
+        for period in periods:
+            cursor.execute(NAVER_CONSENSUS_DDL.format(table=NAVER_CONSENSUS_TABLES[period]))
+            cursor.execute(NAVER_CONSENSUS_INDEX.format(table=NAVER_CONSENSUS_TABLES[period]))
+        cursor.close()
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def sqlite_sink(path, periods=("Y",)):
+    # Engine on a SQLite file with every table created; use it wherever the jobs take a MySQL sqlengine
+    # WAL lets the reads of sync, reconcile and preload run next to the writer thread
+    sqlengine = create_sqlengine("sqlite:///" + path)
+    connection = sqlengine.raw_connection()
+    try:
+        connection.cursor().execute("PRAGMA journal_mode=WAL")
+    finally:
+        connection.close()
+    sqlite_create_tables(sqlengine, periods)
+    return sqlengine
@@ -0,0 +1,116 @@
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+
+# Compact column types for the KRX daily snapshot; ticker and company_name are dictionary-encoded
+KRX_STORE_SCHEMA = pa.schema([
+    ('ticker', pa.dictionary(pa.int32(), pa.string())),
+    ('company_name', pa.dictionary(pa.int32(), pa.string())),
+    ('data_date', pa.date32()),
+    ('price_close', pa.int32()),
+    ('price_change', pa.int32()),
+    ('price_change_pct', pa.float32()),
+    ('volume', pa.int64()),
+    ('trading_value', pa.int64()),
+    ('price_open', pa.int32()),
+    ('price_high', pa.int32()),
+    ('price_low', pa.int32()),
+    ('marketcap', pa.int64()),
+    ('market_weight_pct', pa.float32()),
+    ('shares_issued', pa.int64()),
+    ('foreign_shareholding', pa.int64()),
+    ('foreign_shareholding_pct', pa.float32())
+])
+
+
+def store_partition_path(root, data_date):    # root/year=YYYY/data_date=YYYY-MM-DD.parquet
+    return os.path.join(root, "year={}".format(data_date.year), "data_date={}.parquet".format(data_date.strftime('%Y-%m-%d')))
+
+
+def store_dates(root, start=None, end=None):    # Sorted dates stored under root within [start, end], from file names only
+    dates = []
+    if not os.path.isdir(root):
+        return dates
+    for year_dir in os.listdir(root):
+        if not year_dir.startswith("year="):
+            continue
+        year = int(year_dir[5:])
+        if (start is not None and year < start.year) or (end is not None and year > end.year):
+            continue
+        for name in os.listdir(os.path.join(root, year_dir)):
+            if name.startswith("data_date=") and name.endswith(".parquet"):
+                data_date = date.fromisoformat(name[10:20])
+                if (start is None or data_date >= start) and (end is None or data_date <= end):
+                    dates.append(data_date)
+    return sorted(dates)
+
+
+def store_write(df, root, data_date, schema):    # Write one date partition atomically, replacing any earlier file for that date
+    # df may also be a pyarrow Table already in `schema`
+    table = df if isinstance(df, pa.Table) else pa.Table.from_pandas(df, schema=schema, preserve_index=False, safe=False)
+    path = store_partition_path(root, data_date)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, path + ".tmp", compression='zstd')
+    os.replace(path + ".tmp", path)    # Readers never see a half-written partition
+    return path
+
+
+def store_read(root, schema, start=None, end=None, tickers=None, columns=None, memory_map=True):
+    # Rows for [start, end] as a pyarrow Table; only the partitions in range are opened and only `columns` are decoded
+    paths = [store_partition_path(root, data_date) for data_date in store_dates(root, start, end)]
+    if not paths:
+        return schema.empty_table() if columns is None else schema.empty_table().select(columns)
+    dataset = ds.dataset(paths, schema=schema, format="parquet", filesystem=fs.LocalFileSystem(use_mmap=memory_map))
+    row_filter = None if tickers is None else ds.field('ticker').isin(list(tickers))
+    return dataset.to_table(columns=columns, filter=row_filter)
+
+
+def krx_store_write(df_data, root):    # Save one krx_marketdata_download result as its date partition
+    df_data = df_data[KRX_STORE_SCHEMA.names].copy()
+    df_data['data_date'] = pd.to_datetime(df_data['data_date']).dt.date
+    return store_write(df_data, root, df_data['data_date'].iloc[0], KRX_STORE_SCHEMA)
+
+
+def krx_store_read(root, start=None, end=None, tickers=None, columns=None, memory_map=True):    # Long-format DataFrame of stored KRX snapshots
+    return store_read(root, KRX_STORE_SCHEMA, start, end, tickers, columns, memory_map).to_pandas()
+
+
+def long_to_panels(df, fields):    # field -> wide float64 DataFrame (data_date x ticker) from long rows with data_date, ticker, fields
+    # Scatter values into a dates x tickers array through factorized codes (much cheaper than DataFrame.pivot)
+    date_codes, data_dates = pd.factorize(df['data_date'], sort=True)
+    ticker_codes, ticker_list = pd.factorize(df['ticker'], sort=True)
+    index = pd.Index(data_dates, name='data_date')
+    columns = pd.Index(np.asarray(ticker_list, dtype=object), name='ticker')
+    panels = {}
+    for field in fields:
+        values = np.full((len(data_dates), len(ticker_list)), np.nan)
+        values[date_codes, ticker_codes] = df[field].to_numpy(dtype='float64', na_value=np.nan)
+        panels[field] = pd.DataFrame(values, index=index, columns=columns)
+    return panels
+
+
+def krx_store_panel(root, field, start=None, end=None, tickers=None):    # Wide DataFrame of one field: data_date x ticker
+    table = store_read(root, KRX_STORE_SCHEMA, start, end, tickers, columns=['data_date', 'ticker', field])
+    return long_to_panels(table.to_pandas(), [field])[field]
+
+
+def krx_store_import_sql(sqlengine, root, start, end):    # Copy dates already in krxmarketdata into the store, one month per query
+    for month_start in pd.date_range(start.replace(day=1), end, freq='MS'):
+        month_end = min(month_start + pd.offsets.MonthEnd(0), pd.Timestamp(end))
+        sql = """
+        SELECT
+            *
+        FROM krxmarketdata
+        WHERE data_date BETWEEN '{a}' AND '{b}'
+        ;""".format(a=max(month_start, pd.Timestamp(start)).strftime('%Y-%m-%d'), b=month_end.strftime('%Y-%m-%d'))
+        df_month = pd.read_sql(sql, con=sqlengine)
+        for data_date, df_data in df_month.groupby('data_date'):
+            krx_store_write(df_data, root)
+        print(month_start.strftime('%Y-%m') + ": " + str(df_month['data_date'].nunique()) + " dates imported")
@@ -0,0 +1,191 @@
+import argparse
+import sys
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from equitymarketdata.backfill import krx_is_known_closed
+from equitymarketdata.dates import to_date
+from equitymarketdata.db import create_sqlengine
+from equitymarketdata.pipeline import krx_existing_counts, krx_pipeline
+from equitymarketdata.sink import bulk_write
+from equitymarketdata.timing import RunMetrics
+
+
+# One row per date the KRX download has seen, so a sync never has to aggregate krxmarketdata itself
+KRX_SYNC_TABLE = 'krxmarketdata_sync'
+KRX_SYNC_DDL = """
+CREATE TABLE IF NOT EXISTS krxmarketdata_sync (
+    data_date DATE NOT NULL PRIMARY KEY,
+    row_count INT NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    updated_at DATETIME NOT NULL
+)"""
+KRX_SYNC_SUSPECT = ['empty', 'foreign_missing', 'mismatch']    # Statuses retried by every sync
+KRX_SYNC_STORED = ['exists', 'mismatch', 'written']    # Statuses whose row_count is the number of rows in krxmarketdata
+
+
+def _sync_dates(series):    # datetime.date values from a DATE column (SQLite returns strings)
+    return [day.date() for day in pd.to_datetime(series)]
+
+
+def krx_sync_create(sqlengine):
+    connection = sqlengine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(KRX_SYNC_DDL)
+        cursor.close()
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def krx_sync_bootstrap(sqlengine):
+    # Fill an empty watermark table from krxmarketdata; the one full GROUP BY a database ever needs
+    # Returns the number of dates added (0 when the table was already filled)
+    if len(pd.read_sql("SELECT data_date FROM {} LIMIT 1".format(KRX_SYNC_TABLE), con=sqlengine)) > 0:
+        return 0
+    counts = krx_existing_counts(sqlengine)
+    df_sync = pd.DataFrame({
+        'data_date': _sync_dates(list(counts.keys())),
+        'row_count': list(counts.values()),
+        'status': 'exists',
+        'updated_at': datetime.now().replace(microsecond=0)
+    })
+    return bulk_write(df_sync, KRX_SYNC_TABLE, sqlengine, upsert_keys=['data_date'])
+
+
+def krx_sync_watermark(sqlengine):    # Latest date up to which every date has been settled, or None for an empty table
+    sql = """
+    SELECT
+        MAX(data_date) AS 'watermark'
+    FROM {}
+    WHERE status NOT IN ('{}')
+    ;""".format(KRX_SYNC_TABLE, "', '".join(KRX_SYNC_SUSPECT))
+    watermark = pd.read_sql(sql, con=sqlengine)['watermark'].iloc[0]
+    return None if watermark is None or pd.isna(watermark) else to_date(pd.Timestamp(watermark))
+
+
+def krx_sync_suspect(sqlengine, end=None):    # Dates whose last download has to be repeated, with their status
+    sql = """
+    SELECT
+        data_date, status
+    FROM {}
+    WHERE status IN ('{}')
+    ;""".format(KRX_SYNC_TABLE, "', '".join(KRX_SYNC_SUSPECT))
+    df_suspect = pd.read_sql(sql, con=sqlengine)
+    suspect = dict(zip(_sync_dates(df_suspect['data_date']), df_suspect['status']))
+    return {day: status for day, status in suspect.items() if end is None or day <= end}
+
+
+def krx_sync_counts(sqlengine, start, end):    # data_date -> rows in krxmarketdata for dates in [start, end], from the watermark table
+    sql = """
+    SELECT
+        data_date, row_count
+    FROM {}
+    WHERE data_date BETWEEN '{}' AND '{}' AND status IN ('{}')
+    ;""".format(KRX_SYNC_TABLE, start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'), "', '".join(KRX_SYNC_STORED))
+    df_counts = pd.read_sql(sql, con=sqlengine)
+    return dict(zip(_sync_dates(df_counts['data_date']), df_counts['row_count']))
+
+
+def krx_sync_record(sqlengine, record, existing_counts=None):    # Upsert one krx_pipeline record into the watermark table
+    existing_counts = {} if existing_counts is None else existing_counts
+    data_date = to_date(record['data_date'])
+    status = record['status']
+    if status == 'empty' and data_date < date.today():
+        status = 'closed'    # An empty file is only worth retrying for today, which may not be published yet
+    if status == 'mismatch':
+        row_count = existing_counts.get(data_date, 0)    # What is stored, not what was downloaded
+    elif status in KRX_SYNC_STORED:
+        row_count = record['numtickers']
+    else:
+        row_count = 0
+    df_sync = pd.DataFrame({'data_date': [data_date], 'row_count': [row_count], 'status': [status],
+                            'updated_at': [datetime.now().replace(microsecond=0)]})
+    bulk_write(df_sync, KRX_SYNC_TABLE, sqlengine, upsert_keys=['data_date'])
+
+
+def krx_sync_gaps(sqlengine, end, calendar=None, holidays=None):
+    # Expected sessions between the first recorded date and end without a row in the watermark table, e.g. a date
+    # below the watermark that a failed run never wrote; every date a download has seen, closed or not, has a row
+    # Sessions come from calendar (a TradingCalendar) when given, else from the weekend and fixed-holiday rules
+    df_sync = pd.read_sql("SELECT data_date FROM {};".format(KRX_SYNC_TABLE), con=sqlengine)
+    recorded = set(_sync_dates(df_sync['data_date']))
+    if not recorded:
+        return []
+    is_trading_day = calendar.is_trading_day if calendar is not None else (lambda day: not krx_is_known_closed(day, holidays))
+    return [day.date() for day in pd.date_range(min(recorded), end, freq='D') if day.date() not in recorded and is_trading_day(day.date())]
+
+
+def krx_sync_plan(sqlengine, end, start=None, calendar=None, holidays=None):
+    # Dates to download: everything after the watermark (or from start on an empty table), the suspect dates and the
+    # sessions below the watermark that were never recorded (krx_sync_gaps)
+    # Returns (dates, existing_counts) ready for krx_pipeline
+    watermark = krx_sync_watermark(sqlengine)
+    first = watermark + timedelta(1) if watermark is not None else start
+    if first is None:
+        raise ValueError("the watermark table is empty; a start date is needed for the first sync")
+    dates = set(day.date() for day in pd.date_range(first, end, freq='D'))
+    dates.update(krx_sync_suspect(sqlengine, end))
+    dates.update(krx_sync_gaps(sqlengine, end, calendar, holidays))
+    dates = sorted(dates)
+    existing_counts = krx_sync_counts(sqlengine, dates[0], dates[-1]) if dates else {}
+    return dates, existing_counts
+
+
+def krx_sync(sqlengine, end=None, start=None, **kwargs):
+    # Bring krxmarketdata up to end (default today) using only the watermark table; kwargs go to krx_pipeline
+    # krx_pipeline records each date's outcome as soon as it is written, so an interrupted sync resumes where it stopped
+    # Yields the krx_pipeline records
+    krx_sync_create(sqlengine)
+    krx_sync_bootstrap(sqlengine)
+    dates, existing_counts = krx_sync_plan(sqlengine, date.today() if end is None else end, start,
+                                           kwargs.get('calendar'), kwargs.get('holidays'))
+    yield from krx_pipeline(dates, sqlengine, existing_counts, **kwargs)
+
+
+def main(argv=None):
+    # Non-interactive incremental sync for cron, e.g.
+    #   30 18 * * 1-5  python -m equitymarketdata.sync --sql-url mysql+mysqldb://... --calendar trading_calendar.json
+    # Exit status 1 when some date still needs attention (foreign ownership missing, row count mismatch)
+    parser = argparse.ArgumentParser(description="Incremental KRX market data sync driven by the krxmarketdata_sync table")
+    parser.add_argument("--sql-url", default=None, help="SQLAlchemy URL; default from the config file or EQUITYMARKETDATA_SQL_* variables")
+    parser.add_argument("--start", type=date.fromisoformat, default=None, help="first date, only used on an empty database")
+    parser.add_argument("--end", type=date.fromisoformat, default=None)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate-limit", type=float, default=4)
+    parser.add_argument("--cache", default=None, help="response cache directory")
+    parser.add_argument("--store", default=None, help="Parquet store directory written next to SQL")
+    parser.add_argument("--calendar", default=None, help="trading calendar file, seeded from krxmarketdata when missing")
+    parser.add_argument("--filetype", choices=['xls', 'csv'], default='xls')
+    parser.add_argument("--events", default=None, help="append JSON-lines events of the run to this file")
+    parser.add_argument("--metrics", default=None, help="write Prometheus text metrics to this file when done")
+    args = parser.parse_args(argv)
+
+    cache = None
+    if args.cache is not None:
+        from equitymarketdata.cache import ResponseCache
+        cache = ResponseCache(args.cache)
+    sqlengine = create_sqlengine(args.sql_url)
+    calendar = None
+    if args.calendar is not None:
+        from equitymarketdata.tradingcalendar import krx_trading_calendar
+        calendar = krx_trading_calendar(args.calendar, sqlengine)
+
+    attention = []
+    with RunMetrics('krx_sync', args.events, args.metrics) as metrics:
+        for record in krx_sync(sqlengine, args.end, args.start, fetch_workers=args.workers, rate_limit=args.rate_limit,
+                               cache=cache, filetype=args.filetype, store_path=args.store, calendar=calendar, timer=metrics):
+            if record['status'] in ('foreign_missing', 'mismatch'):
+                attention.append(record)
+            if record['status'] != 'closed':
+                print("{}:{:6d} {}".format(record['data_date'].strftime('%Y-%m-%d'), record['numtickers'], record['status']))
+        metrics.count('days_attention', len(attention))
+    if calendar is not None:
+        calendar.save(args.calendar)
+    return 1 if attention else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+import numpy as np
+
+
+# Upper bounds (seconds) of the stage latency histogram buckets in the Prometheus export
+PROMETHEUS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+
+class StageTimer:    # Collects wall-clock durations per named stage and counters (thread-safe) and reports latency percentiles
+    def __init__(self):
+        self.durations = defaultdict(list)
+        self.counters = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.durations[stage].append(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def count(self, name, n=1):    # Add n to a counter, e.g. retries or skipped rows
+        with self.lock:
+            self.counters[name] += n
+
+    def event(self, kind, **fields):    # Structured event; StageTimer keeps no event log (see RunMetrics)
+        pass
+
+    def summary(self):    # stage -> {count, total, p50, p90, p99, max} (seconds)
+        result = {}
+        with self.lock:
+            for stage, values in self.durations.items():
+                values = np.asarray(values)
+                p50, p90, p99 = np.percentile(values, [50, 90, 99])
+                result[stage] = {'count': len(values), 'total': values.sum(), 'p50': p50, 'p90': p90, 'p99': p99, 'max': values.max()}
+        return result
+
+    def report(self):
+        print("{:<12}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10}".format("stage", "count", "total(s)", "p50(ms)", "p90(ms)", "p99(ms)", "max(ms)"))
+        for stage, s in self.summary().items():
+            print("{:<12}{:>8d}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}".format(
+                stage, s['count'], s['total'], s['p50'] * 1000, s['p90'] * 1000, s['p99'] * 1000, s['max'] * 1000))
+        with self.lock:
+            counters = sorted(self.counters.items())
+        for name, value in counters:
+            print("{:<30}{:>10d}".format(name, value))
+
+
+class NullTimer:    # Takes the place of a StageTimer where nothing is measured, so instrumented code needs no checks
+    def record(self, stage, seconds):
+        pass
+
+    def time(self, stage):
+        return nullcontext()
+
+    def count(self, name, n=1):
+        pass
+
+    def event(self, kind, **fields):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class RunMetrics(StageTimer):
+    # StageTimer for a whole scrape or backfill run that can also
+    # - append structured events as JSON lines to events_path (one object per line: ts, job, event, fields)
+    # - write stage histograms and counters in the Prometheus text format to prometheus_path on close(),
+    #   atomically, for a node_exporter textfile collector or the scheduler to scrape
+    # With both paths None it costs what a StageTimer costs: spans and counters only, event() returns at once
+    def __init__(self, job, events_path=None, prometheus_path=None):
+        super().__init__()
+        self.job = job
+        self.prometheus_path = prometheus_path
+        self.started = time.time()
+        self.events = open(events_path, 'a', encoding='utf8') if events_path is not None else None
+        self.event_lock = threading.Lock()
+        self.event('start')
+
+    def event(self, kind, **fields):
+        if self.events is None:
+            return
+        line = json.dumps(dict({'ts': datetime.now().isoformat(timespec='milliseconds'), 'job': self.job, 'event': kind}, **fields),
+                          ensure_ascii=False, default=str)
+        with self.event_lock:
+            self.events.write(line + "\n")
+            self.events.flush()
+
+    def prometheus_text(self):    # Stage latency histograms, counters and run timestamps in the Prometheus text format
+        job = self.job.replace('\\', '\\\\').replace('"', '\\"')
+        lines = [
+            "# HELP equitymarketdata_stage_seconds Wall-clock time per stage",
+            "# TYPE equitymarketdata_stage_seconds histogram"
+        ]
+        with self.lock:
+            durations = {stage: np.sort(values) for stage, values in self.durations.items()}
+            counters = sorted(self.counters.items())
+        for stage, values in durations.items():
+            labels = 'job="{}",stage="{}"'.format(job, stage)
+            for bound, count in zip(PROMETHEUS_BUCKETS, np.searchsorted(values, PROMETHEUS_BUCKETS, side='right')):
+                lines.append('equitymarketdata_stage_seconds_bucket{{{},le="{}"}} {}'.format(labels, bound, count))
+            lines.append('equitymarketdata_stage_seconds_bucket{{{},le="+Inf"}} {}'.format(labels, len(values)))
+            lines.append('equitymarketdata_stage_seconds_sum{{{}}} {}'.format(labels, values.sum()))
+            lines.append('equitymarketdata_stage_seconds_count{{{}}} {}'.format(labels, len(values)))
+        for name, value in counters:
+            metric = "equitymarketdata_" + re.sub(r'[^a-zA-Z0-9_]', '_', name) + "_total"
+            lines += ["# TYPE " + metric + " counter", '{}{{job="{}"}} {}'.format(metric, job, value)]
+        lines += [
+            "# TYPE equitymarketdata_run_start_timestamp_seconds gauge",
+            'equitymarketdata_run_start_timestamp_seconds{{job="{}"}} {}'.format(job, self.started),
+            "# TYPE equitymarketdata_run_duration_seconds gauge",
+            'equitymarketdata_run_duration_seconds{{job="{}"}} {}'.format(job, time.time() - self.started)
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path=None):
+        path = self.prometheus_path if path is None else path
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, 'w', encoding='utf8') as fd:
+            fd.write(self.prometheus_text())
+        os.replace(tmp, path)    # Never let the scraper see a half-written file
+
+    def close(self):
+        self.event('end', seconds=round(time.time() - self.started, 3), counters=dict(self.counters))
+        if self.prometheus_path is not None:
+            self.write_prometheus()
+        if self.events is not None:
+            self.events.close()
+            self.events = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, timedelta
+
+import pandas as pd
+
+from equitymarketdata.backfill import krx_is_known_closed
+from equitymarketdata.dates import to_date
+
+
+CALENDAR_VERSION = 2    # Files without it were seeded with every stored gap as closed; their closed days are not trusted
+
+
+class TradingCalendar:
+    # KRX sessions and closed weekdays observed so far, kept as sorted lists and searched with bisect
+    # Days never observed fall back to the weekend and fixed-holiday rules of krx_is_known_closed
+    def __init__(self, sessions=(), closed=(), holidays=None):
+        self.sessions = sorted(set(sessions))
+        self.closed = sorted(set(closed))    # Weekdays on which the market was closed (weekends are implied)
+        self.holidays = holidays
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    @staticmethod
+    def _contains(days, day):
+        i = bisect_left(days, day)
+        return i < len(days) and days[i] == day
+
+    def is_trading_day(self, data_date):
+        day = to_date(data_date)
+        if self._contains(self.sessions, day):
+            return True
+        if self._contains(self.closed, day):
+            return False
+        return not krx_is_known_closed(day, self.holidays)
+
+    def previous_trading_day(self, data_date):    # Last trading day strictly before data_date
+        day = to_date(data_date) - timedelta(1)
+        i = bisect_right(self.sessions, day)
+        last_session = self.sessions[i - 1] if i > 0 else None
+        # Only the unobserved days after the last recorded session need the rules, usually none or a few
+        while day != last_session and not self.is_trading_day(day):
+            day -= timedelta(1)
+        return day
+
+    def latest_trading_day(self, data_date):    # data_date itself if it is a trading day, else the one before
+        day = to_date(data_date)
+        return day if self.is_trading_day(day) else self.previous_trading_day(day)
+
+    def trading_days(self, start, end):    # Trading days in [start, end], in order
+        # Recorded sessions are one slice between two bisects; only the days before the first or after the last
+        # recorded session are filled in by the rules, unrecorded days inside that range are not sessions
+        start, end = to_date(pd.Timestamp(start)), to_date(pd.Timestamp(end))
+        if not self.sessions:
+            return self._rule_days(start, end)
+        sessions = self.sessions[bisect_left(self.sessions, start):bisect_right(self.sessions, end)]
+        before = self._rule_days(start, min(end, self.sessions[0] - timedelta(1)))
+        after = self._rule_days(max(start, self.sessions[-1] + timedelta(1)), end)
+        return before + sessions + after
+
+    def _rule_days(self, start, end):    # Days in [start, end] neither recorded closed nor closed by the rules
+        days = []
+        day = start
+        while day <= end:
+            if not self._contains(self.closed, day) and not krx_is_known_closed(day, self.holidays):
+                days.append(day)
+            day += timedelta(1)
+        return days
+
+    def mark(self, data_date, is_trading):    # Record a day observed as a session (non-empty download) or closed (empty)
+        day = to_date(data_date)
+        with self.lock:
+            add, remove = (self.sessions, self.closed) if is_trading else (self.closed, self.sessions)
+            i = bisect_left(remove, day)
+            if i < len(remove) and remove[i] == day:
+                del remove[i]
+            if not self._contains(add, day) and (is_trading or day.weekday() < 5):
+                insort(add, day)
+
+    def save(self, path):    # Atomic: written to a temporary file and renamed over path
+        data = {
+            'version': CALENDAR_VERSION,
+            'sessions': [day.isoformat() for day in self.sessions],
+            'closed': [day.isoformat() for day in self.closed]
+        }
+        with self.lock:
+            with open(path + ".tmp", 'w', encoding='UTF8') as fd:
+                json.dump(data, fd)
+            os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path, holidays=None):
+        with open(path, 'r', encoding='UTF8') as fd:
+            data = json.load(fd)
+        closed = data['closed'] if data.get('version', 1) >= CALENDAR_VERSION else []
+        return cls([date.fromisoformat(day) for day in data['sessions']], [date.fromisoformat(day) for day in closed], holidays)
+
+    @classmethod
+    def from_sql(cls, sqlengine, holidays=None):
+        # Seed with the sessions stored in krxmarketdata. Weekdays missing from the table are left unobserved: a gap may
+        # be a failed run or a skipped foreign_missing day as well as a holiday, so the rules decide and the date is
+        # requested; it is marked closed only once its download comes back empty
+        sql = """
+        SELECT DISTINCT
+            data_date
+        FROM krxmarketdata
+        ;"""
+        sessions = [to_date(pd.Timestamp(day)) for day in pd.read_sql(sql, con=sqlengine)['data_date']]
+        return cls(sessions, holidays=holidays)
+
+
+def krx_trading_calendar(path, sqlengine=None, holidays=None):    # Load the calendar at path, seeding it from SQL the first time
+    if os.path.exists(path):
+        return TradingCalendar.load(path, holidays)
+    calendar = TradingCalendar.from_sql(sqlengine, holidays) if sqlengine is not None else TradingCalendar(holidays=holidays)
+    calendar.save(path)
+    return calendar